@@ -0,0 +1,255 @@
+import sys
+import time
+from collections import namedtuple
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from movingaverages import exp_moving_average, holding_positions, read_file, strategy_returns
+
+# Upper bound on the number of values in each (pairs x days) block evaluated at once
+_BLOCK_SIZE = 2 ** 21
+
+# Moving average matrices shared with the worker processes
+_shared = {}
+
+
+def moving_averages(values, windows, ma_type: str='simple') -> np.ndarray:
+    """Computes a moving average of the values for every window at once, aligned with the values. This is the same as
+       the (rounded) moving averages used by simulate_moving_average in movingaverages.py.
+
+    :param values: The values to perform the moving averages over.
+    :param windows: The moving average windows.
+    :param ma_type: The type of moving average, either "simple" or "exponential".
+    :return: A 2d np array with one row per window, rounded to 2 decimals. Simple moving averages are nan until their
+        window is full.
+    """
+    values = np.asarray(values, dtype=float)
+    windows = np.asarray(windows, dtype=int)
+
+    if ma_type == 'simple':
+        averages = np.full((len(windows), len(values)), np.nan)
+        sums = np.concatenate(([0.], np.cumsum(values)))
+
+        for i, window in enumerate(windows):
+            if window <= len(values):
+                averages[i, window - 1:] = (sums[window:] - sums[:-window]) / window
+    elif ma_type == 'exponential':
+        averages = exp_moving_average(values, windows).reshape(len(windows), len(values))
+    else:
+        raise ValueError('ma_type must be either "simple" or "exponential", got %s instead' % ma_type)
+
+    return np.round(averages, 2)
+
+
+def _summarize_block(pairs: np.ndarray) -> tuple:
+    """Evaluates a block of (short row, long row) pairs of the shared moving average matrix.
+
+    :return: A tuple of np arrays (final log return, trade count, max drawdown).
+    """
+    prices, averages = _shared['prices'], _shared['averages']
+
+    holding = holding_positions(averages[pairs[:, 0]], averages[pairs[:, 1]])
+    log_equity = np.cumsum(strategy_returns(prices, holding), axis=1)
+
+    # One trade per entry into a position, the same as the trade ledger from simulate_moving_average
+    trades = holding[:, 0] + np.count_nonzero(holding[:, 1:] & ~holding[:, :-1], axis=1)
+    drawdown = 1. - np.exp(log_equity - np.maximum.accumulate(log_equity, axis=1))
+
+    return log_equity[:, -1], trades, drawdown.max(axis=1)
+
+
+def _boundary_block(pairs: np.ndarray) -> np.ndarray:
+    """Evaluates a block of (short row, long row) pairs of the shared moving average matrix at the shared boundaries.
+
+    :return: A 2d np array of the log equity at the end of each boundary day, one row per pair.
+    """
+    prices, averages = _shared['prices'], _shared['averages']
+
+    holding = holding_positions(averages[pairs[:, 0]], averages[pairs[:, 1]])
+    log_equity = np.cumsum(strategy_returns(prices, holding), axis=1)
+
+    return log_equity[:, _shared['boundaries']]
+
+
+def _share(shared: dict):
+    _shared.update(shared)
+
+
+def _blocks(pairs: np.ndarray, days: int) -> list:
+    size = max(1, _BLOCK_SIZE // max(days, 1))
+
+    return [pairs[i:i + size] for i in range(0, len(pairs), size)]
+
+
+def _map_blocks(func, shared: dict, pairs: np.ndarray, processes: int=None) -> list:
+    """Applies func to blocks of pairs, optionally spread across a process pool.
+
+    :param func: The function, which reads the prices, moving average matrix (and anything else) from _shared.
+    :param shared: The values to make available in _shared.
+    :param pairs: The (short row, long row) pairs.
+    :param processes: The number of worker processes. Defaults to None, meaning everything runs in this process.
+    """
+    blocks = _blocks(pairs, len(shared['prices']))
+
+    if processes is None or processes <= 1:
+        _share(shared)
+        try:
+            return [func(block) for block in blocks]
+        finally:
+            _shared.clear()
+
+    with Pool(processes, initializer=_share, initargs=(shared,)) as pool:
+        return pool.map(func, blocks)
+
+
+def _parameter_grid(prices: np.ndarray, short_windows, long_windows, ma_types) -> tuple:
+    """Computes the moving average matrix for every window and type, and the (short row, long row) pair for every
+       combination of windows and type.
+
+    :return: A tuple of (moving average matrix, pair rows, parameter table).
+    """
+    short_windows = np.asarray(list(short_windows), dtype=int)
+    long_windows = np.asarray(list(long_windows), dtype=int)
+    windows = np.union1d(short_windows, long_windows)
+
+    averages, pairs, params = [], [], []
+    for i, ma_type in enumerate(ma_types):
+        averages.append(moving_averages(prices, windows, ma_type))
+
+        short_rows = np.searchsorted(windows, short_windows) + i * len(windows)
+        long_rows = np.searchsorted(windows, long_windows) + i * len(windows)
+        pairs.append(np.stack(np.meshgrid(short_rows, long_rows, indexing='ij'), axis=-1).reshape(-1, 2))
+
+        params.append(pd.DataFrame({
+            'maw1': np.repeat(short_windows, len(long_windows)),
+            'maw2': np.tile(long_windows, len(short_windows)),
+            'ma_type': ma_type,
+        }))
+
+    return np.concatenate(averages), np.concatenate(pairs), pd.concat(params, ignore_index=True)
+
+
+def sweep_moving_averages(prices, short_windows, long_windows, ma_types=('simple', 'exponential'),
+                          investment: int=10000, processes: int=None) -> pd.DataFrame:
+    """Evaluates the moving average crossover strategy (see simulate_moving_average in movingaverages.py) for every
+       combination of short window, long window and moving average type.
+
+    :param prices: The prices.
+    :param short_windows: The short moving average windows (e.g. range(2, 102)).
+    :param long_windows: The long moving average windows.
+    :param ma_types: The types of moving average, "simple" and/or "exponential".
+    :param investment: The initial investment.
+    :param processes: The number of worker processes. Defaults to None, meaning everything runs in this process.
+    :return: A data frame with a row for each combination with the columns maw1, maw2, ma_type, final_equity,
+        absolute_returns, relative_returns (in percent), trades and max_drawdown (as a fraction of the peak equity).
+    """
+    prices = np.asarray(prices, dtype=float)
+    averages, pairs, results = _parameter_grid(prices, short_windows, long_windows, ma_types)
+
+    summaries = _map_blocks(_summarize_block, {'prices': prices, 'averages': averages}, pairs, processes)
+    final_log, trades, drawdown = (np.concatenate(column) for column in zip(*summaries))
+
+    results['final_equity'] = investment * np.exp(final_log)
+    results['absolute_returns'] = results['final_equity'] - investment
+    results['relative_returns'] = results['absolute_returns'] / investment * 100
+    results['trades'] = trades
+    results['max_drawdown'] = drawdown
+
+    return results
+
+
+# The result of a walk-forward optimization. folds has a row per fold and equity is the stitched out-of-sample
+# equity at the end of each of the given days.
+WalkForwardResult = namedtuple('WalkForwardResult', ['folds', 'equity', 'days'])
+
+
+def walk_forward(prices, short_windows, long_windows, train_days: int, test_days: int,
+                 ma_types=('simple', 'exponential'), investment: int=10000, processes: int=None) -> WalkForwardResult:
+    """Walk-forward optimization of the moving average crossover strategy. A training window followed by an
+       out-of-sample test window slides across the prices, moving by test_days each fold. The combination with the
+       best return in each training window is traded in the following test window, and the test windows are stitched
+       into one equity curve.
+
+    The moving averages and positions of every combination are computed once over the whole series (they only depend
+    on earlier prices) and reduced to the log equity at the fold boundaries, so each fold is a lookup rather than a new
+    sweep. A combination carries its position over from before the test window, as it would when trading live.
+
+    :param prices: The prices.
+    :param short_windows: The short moving average windows.
+    :param long_windows: The long moving average windows.
+    :param train_days: The length of each training window.
+    :param test_days: The length of each test window.
+    :param ma_types: The types of moving average, "simple" and/or "exponential".
+    :param investment: The initial investment.
+    :param processes: The number of worker processes. Defaults to None, meaning everything runs in this process.
+    :return: The result of the walk-forward optimization. The folds data frame has the columns train_start,
+        test_start, test_end (day indices, end exclusive), maw1, maw2, ma_type, train_returns and test_returns (in
+        percent).
+    """
+    prices = np.asarray(prices, dtype=float)
+
+    if train_days < 2 or test_days < 1:
+        raise ValueError('train_days must be at least 2 and test_days at least 1, got %s and %s instead' %
+                         (train_days, test_days))
+
+    train_start = np.arange(0, len(prices) - train_days, test_days)
+    if len(train_start) == 0:
+        raise ValueError('Not enough prices (%s) for a training window of %s days' % (len(prices), train_days))
+
+    test_start = train_start + train_days
+    test_end = np.minimum(test_start + test_days, len(prices))
+
+    averages, pairs, params = _parameter_grid(prices, short_windows, long_windows, ma_types)
+
+    # Log equity at the end of the first day of each training window and the last day of each training/test window
+    boundaries = np.unique(np.concatenate((train_start, test_start - 1, test_end - 1)))
+    shared = {'prices': prices, 'averages': averages, 'boundaries': boundaries}
+    log_equity = np.concatenate(_map_blocks(_boundary_block, shared, pairs, processes))
+
+    def at(days):
+        return log_equity[:, np.searchsorted(boundaries, days)]
+
+    train_log = at(test_start - 1) - at(train_start)
+    best = np.argmax(train_log, axis=0)
+    test_log = (at(test_end - 1) - at(test_start - 1))[best, np.arange(len(best))]
+
+    folds = params.iloc[best].reset_index(drop=True)
+    folds.insert(0, 'train_start', train_start)
+    folds.insert(1, 'test_start', test_start)
+    folds.insert(2, 'test_end', test_end)
+    folds['train_returns'] = np.expm1(train_log[best, np.arange(len(best))]) * 100
+    folds['test_returns'] = np.expm1(test_log) * 100
+
+    # Stitch the daily returns of each fold's chosen combination over its test window
+    chosen, fold_rows = np.unique(best, return_inverse=True)
+    returns = strategy_returns(prices, holding_positions(averages[pairs[chosen, 0]], averages[pairs[chosen, 1]]))
+
+    days = np.arange(test_start[0] - 1, test_end[-1])
+    daily = np.zeros(len(days))
+    for fold, row in enumerate(fold_rows):
+        daily[test_start[fold] - days[0]:test_end[fold] - days[0]] = returns[row, test_start[fold]:test_end[fold]]
+
+    return WalkForwardResult(folds, investment * np.exp(np.cumsum(daily)), days)
+
+
+if __name__ == '__main__':
+    file_path = sys.argv[1] if len(sys.argv) > 1 else '../data/coinmarketcap/bitcoin.csv'
+
+    _, _, _, _, prices, _ = read_file(file_path, {
+        'date': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5
+    })
+
+    start = time.perf_counter()
+    results = sweep_moving_averages(prices, range(2, 102), range(2, 102))
+    print('Evaluated %s combinations over %s days in %.2fs' % (len(results), len(prices), time.perf_counter() - start))
+
+    print(results.sort_values('final_equity', ascending=False).head(20).to_string(index=False))
+
+    start = time.perf_counter()
+    walk = walk_forward(prices, range(2, 102), range(2, 102), train_days=365, test_days=90)
+    print('Walked forward over %s folds in %.2fs' % (len(walk.folds), time.perf_counter() - start))
+
+    print(walk.folds.to_string(index=False))
+    print('Out-of-sample equity: %s' % walk.equity[-1])
@@ -0,0 +1,338 @@
+import csv
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import matplotlib.dates as mdates
+import pandas as pd
+
+from cache import default_cache
+from csv_aggregate import Interval, aggregate_ticks
+from correlation import RollingCorrelation, autocorr, autocorr_range, correlation_significance, rolling_correlation
+from loader import read_price_file
+from movingaverages import relative_strength
+
+COINMARKETCAP_COLUMNS = {'date': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5}
+
+
+def timed(func, *args, **kwargs):
+    """Runs a function and times it.
+
+    :param func: The function.
+    :return: A tuple of (seconds taken, result of the function).
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+
+    return time.perf_counter() - start, result
+
+
+@contextmanager
+def uncached():
+    """Turns off the indicator cache, so the computations themselves are timed."""
+    enabled = default_cache.enabled
+    default_cache.enabled = False
+    try:
+        yield
+    finally:
+        default_cache.enabled = enabled
+
+
+def random_walk(rows: int, seed: int=0):
+    """Creates a positive random walk that looks enough like a price series for benchmarking.
+
+    :param rows: The number of values.
+    :param seed: The random seed.
+    :return: An np array of prices.
+    """
+    random = np.random.RandomState(seed)
+
+    return 100. * np.exp(np.cumsum(random.normal(0., 0.01, rows)))
+
+
+def relative_strength_loop(values, window: int=14):
+    """The original per-value loop implementation of relative_strength, kept as a reference."""
+    deltas = np.diff(values)
+    seed = deltas[:window + 1]
+    up = seed[seed >= 0].sum() / window
+    down = -seed[seed < 0].sum() / window
+    rs = up / down
+    rsi = np.zeros_like(values)
+    rsi[:window] = 100. - 100. / (1. + rs)
+
+    for i in range(window, len(values)):
+        delta = deltas[i - 1]  # cause the diff is 1 shorter
+
+        if delta > 0:
+            upval = delta
+            downval = 0.
+        else:
+            upval = 0.
+            downval = -delta
+
+        up = (up * (window - 1) + upval) / window
+        down = (down * (window - 1) + downval) / window
+
+        rs = up / down
+        rsi[i] = 100. - 100. / (1. + rs)
+
+    return rsi
+
+
+def benchmark_relative_strength(sizes: tuple=(10 ** 4, 10 ** 6, 10 ** 7), windows: tuple=(9, 14, 25)):
+    print('relative_strength (window %s)' % windows[0])
+    for rows in sizes:
+        prices = random_walk(rows)
+
+        loop_time, expected = timed(relative_strength_loop, prices, windows[0])
+        with uncached():
+            fast_time, actual = timed(relative_strength, prices, windows[0])
+            multi_time, _ = timed(relative_strength, prices, list(windows))
+
+        print('%10s rows  loop: %8.3fs  vectorized: %8.3fs  speedup: %6.1fx  %s windows: %8.3fs  max error: %.2e' %
+              (rows, loop_time, fast_time, loop_time / fast_time, len(windows), multi_time,
+               np.max(np.abs(expected - actual))))
+
+
+def write_price_file(file_path: str, rows: int, seed: int=0):
+    """Writes a synthetic coinmarketcap style csv (newest row first), cycling through 20 years of dates.
+
+    :param file_path: The path of the file.
+    :param rows: The number of rows.
+    :param seed: The random seed.
+    """
+    chunk = 10 ** 6
+    days = pd.date_range('2000-01-01', periods=20 * 365).strftime('%d/%m/%Y').values
+
+    with open(file_path, 'w') as file:
+        file.write('Date;Open;High;Low;Close;Volume;MarketCap\n')
+
+        for start in range(0, rows, chunk):
+            n = min(chunk, rows - start)
+            prices = np.round(random_walk(n, seed + start), 2)
+            df = pd.DataFrame({'date': days[(rows - start - np.arange(n)) % len(days)], 'open': prices,
+                               'high': prices + 1, 'low': prices - 1, 'close': prices,
+                               'volume': np.round(prices * 1000), 'cap': np.round(prices * 10000)})
+            df.to_csv(file, sep=';', header=False, index=False)
+
+
+def read_price_file_csv(file_path: str, column_map: dict, delimiter: str=';', dt_format: str='%d/%m/%Y',
+                        header: bool=True, reverse: bool=True, num_rows: int=-1):
+    """The original csv.reader implementation of read_file, kept as a reference."""
+    with open(file_path, 'r') as file:
+        data = list(csv.reader(file, delimiter=delimiter))
+
+        if header:
+            data = data[1:]
+
+        if reverse:
+            data = list(reversed(data))
+
+        if num_rows > -1:
+            data = data[-num_rows:]
+
+        n = np.array(data)
+
+        def datefix(d: str):
+            return mdates.date2num(datetime.strptime(d.replace('v', '/'), dt_format))
+
+        return (np.array(list(map(datefix, n[:, column_map['date']]))),
+                np.array(n[:, column_map['open']], dtype=float),
+                np.array(n[:, column_map['high']], dtype=float),
+                np.array(n[:, column_map['low']], dtype=float),
+                np.array(n[:, column_map['close']], dtype=float),
+                np.array(n[:, column_map['volume']], dtype=float))
+
+
+def benchmark_read_file(sizes: tuple=(10 ** 5, 10 ** 6, 10 ** 7), reference_limit: int=2 * 10 ** 6):
+    """Compares read_price_file with the original csv.reader implementation. The reference holds every row as a list
+       of strings, so it is skipped above reference_limit rows to keep memory in check.
+    """
+    print('read_file')
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'prices.csv')
+            write_price_file(file_path, rows)
+
+            fast_time, actual = timed(read_price_file, file_path, COINMARKETCAP_COLUMNS)
+            tail_time, _ = timed(read_price_file, file_path, COINMARKETCAP_COLUMNS, num_rows=1000)
+
+            print('%10s rows  loader: %8.3fs (%.0f rows/s)  last 1000 rows: %8.3fs' %
+                  (rows, fast_time, rows / fast_time, tail_time), end='')
+
+            if rows <= reference_limit:
+                csv_time, expected = timed(read_price_file_csv, file_path, COINMARKETCAP_COLUMNS)
+                print('  csv.reader: %8.3fs  speedup: %6.1fx  match: %s' %
+                      (csv_time, csv_time / fast_time, all(np.array_equal(e, a) for e, a in zip(expected, actual))))
+            else:
+                print('  csv.reader: skipped')
+
+
+def autocorr_range_loop(a: np.ndarray, b: np.ndarray, lag_range: int=0):
+    """The original per-lag np.corrcoef implementation of autocorr_range, kept as a reference."""
+    pos = np.array([autocorr(a, b, i) for i in range(lag_range + 1)])
+    neg = np.array([autocorr(b, a, i) for i in reversed(range(1, lag_range + 1))])
+
+    return np.concatenate((neg, pos))
+
+
+def benchmark_autocorr_range(sizes: tuple=((10 ** 4, 100), (10 ** 5, 1000), (10 ** 6, 1000)), pairs: int=16):
+    print('autocorr_range')
+    for rows, lag_range in sizes:
+        a = np.diff(np.log(random_walk(rows + 1, 1)))
+        b = np.diff(np.log(random_walk(rows + 1, 2)))
+
+        loop_time, expected = timed(autocorr_range_loop, a, b, lag_range)
+        with uncached():
+            fft_time, actual = timed(autocorr_range, a, b, lag_range)
+            stack_time, _ = timed(autocorr_range, np.tile(a, (pairs, 1)), np.tile(b, (pairs, 1)), lag_range)
+
+        print('%10s rows  %5s lags  loop: %8.3fs  fft: %8.3fs  speedup: %7.1fx  %s pairs: %8.3fs  max error: %.2e' %
+              (rows, lag_range, loop_time, fft_time, loop_time / fft_time, pairs, stack_time,
+               np.max(np.abs(expected - actual))))
+
+
+def rolling_correlation_loop(a: np.ndarray, b: np.ndarray, window: int):
+    """Rolling correlation with one np.corrcoef per window, kept as a reference."""
+    correlation = np.full(len(a), np.nan)
+    for i in range(window - 1, len(a)):
+        correlation[i] = np.corrcoef(a[i - window + 1:i + 1], b[i - window + 1:i + 1])[0, 1]
+
+    return correlation
+
+
+def benchmark_rolling_correlation(sizes: tuple=(10 ** 4, 10 ** 5, 10 ** 6), window: int=24 * 30,
+                                  reference_limit: int=10 ** 5):
+    """Compares rolling_correlation and RollingCorrelation with one np.corrcoef per window (skipped above
+       reference_limit rows, where it takes minutes).
+    """
+    print('rolling_correlation (window %s)' % window)
+    for rows in sizes:
+        a = np.diff(np.log(random_walk(rows + 1, 1)))
+        b = np.diff(np.log(random_walk(rows + 1, 2)))
+
+        fast_time, actual = timed(rolling_correlation, a, b, window)
+        stream_time, streamed = timed(RollingCorrelation(window).update_batch, a, b)
+
+        print('%10s rows  cumsum: %8.3fs  streaming: %8.3fs (%.0f updates/s, max error: %.2e)' %
+              (rows, fast_time, stream_time, rows / stream_time, np.nanmax(np.abs(streamed - actual))), end='')
+
+        if rows <= reference_limit:
+            loop_time, expected = timed(rolling_correlation_loop, a, b, window)
+            print('  corrcoef: %8.3fs  speedup: %7.1fx  max error: %.2e' %
+                  (loop_time, loop_time / fast_time, np.nanmax(np.abs(expected - actual))))
+        else:
+            print('  corrcoef: skipped')
+
+
+def benchmark_correlation_significance(sizes: tuple=(50, 1000), resamples: int=10000, lag_range: int=50):
+    print('correlation_significance (%s resamples, %s lags)' % (resamples, 2 * lag_range + 1))
+    for rows in sizes:
+        a = np.diff(np.log(random_walk(rows + 1, 1)))
+        b = np.diff(np.log(random_walk(rows + 1, 2)))
+
+        with uncached():
+            permutation_time, _ = timed(correlation_significance, a, b, lag_range, resamples)
+            block_time, _ = timed(correlation_significance, a, b, lag_range, resamples, method='block')
+
+        print('%10s rows  permutation: %8.3fs  block bootstrap: %8.3fs' % (rows, permutation_time, block_time))
+
+
+def write_tick_file(file_path: str, rows: int, days: int=365, seed: int=0):
+    """Writes a synthetic Bitfinex style trade csv (timestamp,amount,price) spread over a number of days.
+
+    :param file_path: The path of the file.
+    :param rows: The number of ticks.
+    :param days: The number of days the ticks cover.
+    :param seed: The random seed.
+    """
+    random = np.random.RandomState(seed)
+    seconds = np.sort(random.randint(0, days * 86400, rows))
+    timestamps = pd.Series(np.datetime_as_string(np.datetime64('2017-01-01T00:00:00') + seconds)).str.replace('T', ' ')
+
+    # Some of the real files have fractions of seconds
+    timestamps[::3] += '.5'
+
+    pd.DataFrame({'timestamp': timestamps, 'amount': np.round(random.normal(0., 1., rows), 4),
+                  'price': np.round(random_walk(rows, seed), 2)}).to_csv(file_path, index=False)
+
+
+def aggregate_file_loop(file_path: str, interval_format: str='%Y-%m-%d %H:00:00') -> list:
+    """The original line by line implementation of csv_aggregate.aggregate_file (without the gap filling), kept as a
+       reference.
+    """
+    data = []
+    previous, interval_count, interval_sum = None, 0, 0.
+
+    with open(file_path, 'r') as file:
+        next(file)
+
+        for line in file:
+            timestamp, _, price = line.rstrip('\n').split(',')
+
+            try:
+                current = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                current = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S.%f')
+
+            bucket = datetime.strptime(current.strftime(interval_format), interval_format)
+
+            if previous is not None and bucket != previous:
+                data.append((previous.timestamp(), interval_sum / interval_count))
+                interval_count, interval_sum = 0, 0.
+
+            interval_count += 1
+            interval_sum += float(price)
+            previous = bucket
+
+    if interval_count:
+        data.append((previous.timestamp(), interval_sum / interval_count))
+
+    return data
+
+
+def benchmark_aggregate(sizes: tuple=(10 ** 5, 10 ** 6, 5 * 10 ** 6), reference_limit: int=10 ** 6):
+    """Compares aggregate_ticks with a line by line loop (skipped above reference_limit rows) on a year of ticks."""
+    print('aggregate_ticks (hour bars over a year)')
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'ticks.csv')
+            write_tick_file(file_path, rows)
+
+            fast_time, bars = timed(aggregate_ticks, file_path, Interval.Hour)
+            print('%10s rows  vectorized: %8.3fs (%.0f rows/s)' % (rows, fast_time, rows / fast_time), end='')
+
+            if rows <= reference_limit:
+                loop_time, expected = timed(aggregate_file_loop, file_path)
+                expected = np.array([mean for _, mean in expected])
+                print('  loop: %8.3fs  speedup: %6.1fx  max relative error: %.2e' %
+                      (loop_time, loop_time / fast_time, np.max(np.abs(expected / (bars['sum'] / bars['count']) - 1))))
+            else:
+                print('  loop: skipped')
+
+
+BENCHMARKS = {
+    'aggregate': benchmark_aggregate,
+    'autocorr': benchmark_autocorr_range,
+    'read_file': benchmark_read_file,
+    'rolling_corr': benchmark_rolling_correlation,
+    'rsi': benchmark_relative_strength,
+    'significance': benchmark_correlation_significance,
+}
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+
+    if len(args) == 0:
+        print('Benchmark not specified. Specify one or more of the following: %s' % ' '.join(sorted(BENCHMARKS)))
+    else:
+        for name in args:
+            if name not in BENCHMARKS:
+                print('Invalid benchmark %s. Specify one of the following: %s' % (name, ' '.join(sorted(BENCHMARKS))))
+            else:
+                BENCHMARKS[name]()
@@ -0,0 +1,290 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+# Part of every cache key. Bump it when a change to an indicator's helpers (which aren't part of its key) changes its
+# results, so stale entries on disk are no longer found.
+CACHE_VERSION = 1
+
+
+def _hash_value(digest, value):
+    """Feeds a value into a hash. np arrays are hashed by their dtype, shape and bytes."""
+    if hasattr(value, 'values') and isinstance(getattr(value, 'values'), np.ndarray):
+        value = value.values  # pandas Series and DataFrames
+
+    if isinstance(value, np.ndarray) and value.dtype.hasobject:
+        digest.update(('object ndarray:%s:' % (value.shape,)).encode('utf-8'))
+        _hash_value(digest, value.tolist())
+    elif isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        digest.update(('ndarray:%s:%s:' % (value.dtype.str, value.shape)).encode('utf-8'))
+        digest.update(value.view(np.uint8).data if value.size else b'')
+    elif isinstance(value, (list, tuple)):
+        digest.update(('%s:%s:' % (type(value).__name__, len(value))).encode('utf-8'))
+        for item in value:
+            _hash_value(digest, item)
+    elif isinstance(value, dict):
+        digest.update(('dict:%s:' % len(value)).encode('utf-8'))
+        for k in sorted(value, key=repr):
+            _hash_value(digest, k)
+            _hash_value(digest, value[k])
+    else:
+        digest.update(('%s:%r;' % (type(value).__name__, value)).encode('utf-8'))
+
+
+def _hash_code(digest, code):
+    """Feeds a code object's bytecode and constants (including those of nested functions) into a hash."""
+    digest.update(code.co_code)
+
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            _hash_code(digest, const)
+        elif isinstance(const, frozenset):
+            _hash_value(digest, sorted(repr(c) for c in const))  # Set order changes between runs
+        else:
+            _hash_value(digest, const)
+
+
+def cache_key(func, args: tuple, kwargs: dict) -> str:
+    """Builds the key of a function call from the function's name and code, CACHE_VERSION, the contents of its array
+       arguments and the rest of its parameters (with defaults filled in, so f(x) and f(x, 14) share a key when 14 is
+       the default). Changing the function's code changes its keys, so the disk tier doesn't return stale results.
+
+    :param func: The function.
+    :param args: The positional arguments.
+    :param kwargs: The keyword arguments.
+    :return: A hex digest.
+    """
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+
+    digest = hashlib.sha1(('%s.%s:%s:' % (func.__module__, func.__qualname__, CACHE_VERSION)).encode('utf-8'))
+    _hash_code(digest, func.__code__)
+
+    for name, value in bound.arguments.items():
+        _hash_value(digest, name)
+        _hash_value(digest, value)
+
+    return digest.hexdigest()
+
+
+def _copy(value):
+    """Copies the arrays in a cached value so callers can't modify the cached copy."""
+    if isinstance(value, np.ndarray):
+        return value.copy()
+
+    if isinstance(value, tuple):
+        return type(value)(*map(_copy, value)) if hasattr(value, '_fields') else tuple(map(_copy, value))
+
+    if isinstance(value, list):
+        return list(map(_copy, value))
+
+    return value
+
+
+def _nbytes(value) -> int:
+    """Estimates the memory used by the arrays in a cached value."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    if isinstance(value, (list, tuple)):
+        return sum(map(_nbytes, value))
+
+    return 64
+
+
+class IndicatorCache:
+    """A cache of function results keyed by a hash of the arguments (see cache_key), with an in-memory LRU tier and an
+       optional on-disk tier. The disk tier evicts the least recently used files once it grows past its size limit.
+    """
+
+    def __init__(self, max_entries: int=256, memory_limit: int=256 * 2 ** 20, disk_directory: str=None,
+                 disk_limit: int=512 * 2 ** 20):
+        """Creates the cache.
+
+        :param max_entries: The number of results kept in memory.
+        :param memory_limit: The size limit of the memory tier in bytes.
+        :param disk_directory: The directory of the disk tier. Defaults to None, meaning there is no disk tier.
+        :param disk_limit: The size limit of the disk tier in bytes.
+        """
+        self.max_entries = max_entries
+        self.memory_limit = memory_limit
+        self.disk_directory = disk_directory
+        self.disk_limit = disk_limit
+        self.enabled = True
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._memory_size = 0
+
+        if disk_directory is not None:
+            os.makedirs(disk_directory, exist_ok=True)
+
+    def stats(self) -> dict:
+        """:return: A dict of the hit and miss counters and the number and size of the entries in memory."""
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'entries': len(self._memory),
+                'bytes': self._memory_size}
+
+    def clear(self, disk: bool=False):
+        """Empties the memory tier (and the disk tier if disk is True) and resets the counters."""
+        self._memory.clear()
+        self._memory_size = 0
+        self.hits = self.disk_hits = self.misses = 0
+
+        if disk and self.disk_directory is not None:
+            for name in os.listdir(self.disk_directory):
+                if name.endswith('.pkl'):
+                    os.remove(os.path.join(self.disk_directory, name))
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_directory, '%s.pkl' % key)
+
+    def get(self, key: str):
+        """Looks up a key.
+
+        :param key: The key.
+        :return: A tuple of (found, value).
+        """
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return True, self._memory[key]
+
+        if self.disk_directory is not None:
+            try:
+                with open(self._disk_path(key), 'rb') as file:
+                    value = pickle.load(file)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+            else:
+                try:
+                    os.utime(self._disk_path(key))  # Mark as recently used
+                except OSError:
+                    pass  # Evicted since it was read, which doesn't change the value
+
+                self.disk_hits += 1
+                self._remember(key, value)
+                return True, value
+
+        self.misses += 1
+        return False, None
+
+    def put(self, key: str, value):
+        """Stores a copy of a value in memory (unless it is bigger than memory_limit), so later changes to the value
+           don't reach the cache, and on disk (if there is a disk tier).
+
+        :param key: The key.
+        :param value: The value.
+        """
+        self._remember(key, _copy(value) if _nbytes(value) <= self.memory_limit else value)
+
+        if self.disk_directory is not None:
+            temporary = '%s.%s.tmp' % (self._disk_path(key), os.getpid())
+            with open(temporary, 'wb') as file:
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._disk_path(key))
+
+            self._evict_disk()
+
+    def _remember(self, key: str, value):
+        if key in self._memory:
+            self._memory_size -= _nbytes(self._memory.pop(key))
+
+        # A value bigger than the whole memory tier would only evict everything else
+        if _nbytes(value) > self.memory_limit:
+            return
+
+        self._memory[key] = value
+        self._memory_size += _nbytes(value)
+
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_size > self.memory_limit):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= _nbytes(evicted)
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_directory):
+            if name.endswith('.pkl'):
+                try:
+                    stat = os.stat(os.path.join(self.disk_directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_limit:
+                break
+
+            try:
+                os.remove(os.path.join(self.disk_directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def memoize(self, func):
+        """Decorates a function so its results are cached. Arrays are copied into the cache on a miss and out of it on
+           a hit, so callers can change the results they get.
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+
+            key = cache_key(func, args, kwargs)
+            found, value = self.get(key)
+
+            if not found:
+                value = func(*args, **kwargs)
+                self.put(key, value)
+                return value
+
+            return _copy(value)
+
+        wrapper.cache = self
+
+        return wrapper
+
+
+# The cache used by the indicator functions in movingaverages.py and correlation.py
+default_cache = IndicatorCache()
+
+
+def cached(func):
+    """Caches a function's results in default_cache."""
+    return default_cache.memoize(func)
+
+
+def configure(max_entries: int=None, memory_limit: int=None, disk_directory: str=None, disk_limit: int=None,
+              enabled: bool=None):
+    """Changes the settings of default_cache.
+
+    :param max_entries: The number of results kept in memory.
+    :param memory_limit: The size limit of the memory tier in bytes.
+    :param disk_directory: The directory of the disk tier.
+    :param disk_limit: The size limit of the disk tier in bytes.
+    :param enabled: Whether results are cached at all.
+    """
+    if max_entries is not None:
+        default_cache.max_entries = max_entries
+
+    if memory_limit is not None:
+        default_cache.memory_limit = memory_limit
+
+    if disk_directory is not None:
+        os.makedirs(disk_directory, exist_ok=True)
+        default_cache.disk_directory = disk_directory
+
+    if disk_limit is not None:
+        default_cache.disk_limit = disk_limit
+
+    if enabled is not None:
+        default_cache.enabled = enabled
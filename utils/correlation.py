@@ -1,8 +1,17 @@
-import csv
+from collections import deque, namedtuple
+from multiprocessing import Pool
+
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
-import matplotlib.dates as mdates
+from cache import cached
+from loader import read_columns, read_price_file
+
+# Largest number of values of a batch of resamples handed to cross_correlation at once
+_RESAMPLE_BATCH_VALUES = 2 ** 22
+
+# Observed lagged correlations with p-values and the band the correlations of unrelated series fall in
+Significance = namedtuple('Significance', ['correlation', 'p_values', 'adjusted_p_values', 'lower', 'upper'])
 
 
 def read_currency_file(file_path: str, column_map: dict, delimiter: str=';', dt_format: str='%d/%m/%Y',
@@ -19,33 +28,7 @@ def read_currency_file(file_path: str, column_map: dict, delimiter: str=';', dt_
     :param num_rows: The number of rows that should be kept.
     :return: A tuple of np arrays (date, open_price, high_price, low_price, close_price, volume).
     """
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file, delimiter=delimiter)
-
-        if reader is None:
-            raise ValueError('File %s is not a valid csv!' % file_path)
-
-        data = list(reader)
-
-        if header:
-            data = data[1:]
-
-        if reverse:
-            data = list(reversed(data))
-
-        if num_rows > -1:
-            data = data[-num_rows:]
-
-        n = np.array(data)
-
-        date = np.array(list(map(mdates.strpdate2num(dt_format), n[:, column_map['date']])))
-        open_price = np.array(n[:, column_map['open']], dtype=float)
-        high_price = np.array(n[:, column_map['high']], dtype=float)
-        low_price = np.array(n[:, column_map['low']], dtype=float)
-        close_price = np.array(n[:, column_map['close']], dtype=float)
-        volume = np.array(n[:, column_map['volume']], dtype=float)
-
-        return date, open_price, high_price, low_price, close_price, volume
+    return read_price_file(file_path, column_map, delimiter, dt_format, header, reverse, num_rows)
 
 
 def read_subscriber_file(file_path: str, delimiter: str=',', dt_format: str='%Y-%m-%d',
@@ -60,29 +43,91 @@ def read_subscriber_file(file_path: str, delimiter: str=',', dt_format: str='%Y-
     :param num_rows: The number of rows that should be kept.
     :return: A tuple of np arrays (date, growth).
     """
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file, delimiter=delimiter)
+    return read_columns(file_path, {'date': 0, 'growth': 1}, ('growth',), delimiter, dt_format, header, reverse,
+                        num_rows, dtypes={'growth': int})
+
+
+def _unique_sorted(dates: np.ndarray, values: np.ndarray) -> tuple:
+    """Sorts a series by date and keeps the last value of any repeated date."""
+    dates = np.asarray(dates)
+    values = np.asarray(values, dtype=float)
+
+    if np.any(dates[1:] < dates[:-1]):
+        order = np.argsort(dates, kind='mergesort')
+        dates, values = dates[order], values[order]
+
+    last = np.ones(len(dates), dtype=bool)
+    last[:-1] = dates[1:] != dates[:-1]
+
+    return dates[last], values[last]
+
+
+def _fill(matrix: np.ndarray, fill) -> np.ndarray:
+    """Fills the nans of each row forward ('ffill'), backward ('bfill') or with a constant."""
+    if fill is None:
+        return matrix
+
+    if fill not in ('ffill', 'bfill'):
+        return np.where(np.isnan(matrix), float(fill), matrix)
+
+    if fill == 'bfill':
+        return _fill(matrix[:, ::-1], 'ffill')[:, ::-1]
+
+    columns = np.arange(matrix.shape[1])
+    source = np.maximum.accumulate(np.where(np.isnan(matrix), -1, columns), axis=1)
+    rows = np.arange(matrix.shape[0])[:, None]
+
+    return np.where(source >= 0, matrix[rows, np.maximum(source, 0)], np.nan)
+
+
+def align_series(series: list, how: str='inner', fill=None, on: np.ndarray=None, tolerance: float=None) -> tuple:
+    """Puts several series (e.g. from read_currency_file and read_subscriber_file) on the same dates.
+
+    Everything is done with sorted set operations and np.searchsorted, so it works on files of any interval and
+    millions of rows.
 
-        if reader is None:
-            raise ValueError('File %s is not a valid csv!' % file_path)
+    :param series: A list of tuples of np arrays (date, values). Repeated dates keep their last value.
+    :param how: "inner" (the dates every series has), "outer" (the dates any series has, nan where a series has no
+        value) or "asof" (the dates in on, each series giving its latest value at or before the date).
+    :param fill: How to fill the remaining nans: None (leave them), "ffill" (carry the last value forward), "bfill"
+        (carry the next value backward) or a number.
+    :param on: The dates to align an "asof" join on. Defaults to None, meaning the dates of the first series.
+    :param tolerance: The largest age of a value used by an "asof" join (in date units, so days for matplotlib dates).
+        Defaults to None, meaning any age.
+    :return: A tuple of (np array of dates, 2-D np array with one row of values per series).
+    """
+    series = [_unique_sorted(dates, values) for dates, values in series]
 
-        data = list(reader)
+    if how == 'inner':
+        dates = series[0][0]
+        for other, _ in series[1:]:
+            dates = np.intersect1d(dates, other, assume_unique=True)
+    elif how == 'outer':
+        dates = np.unique(np.concatenate([d for d, _ in series]))
+    elif how == 'asof':
+        dates = series[0][0] if on is None else np.sort(np.asarray(on))
+    else:
+        raise ValueError('how must be one of "inner", "outer" or "asof", got %s instead' % how)
 
-        if header:
-            data = data[1:]
+    matrix = np.full((len(series), len(dates)), np.nan)
 
-        if reverse:
-            data = list(reversed(data))
+    for row, (series_dates, values) in enumerate(series):
+        if how == 'asof':
+            index = np.searchsorted(series_dates, dates, side='right') - 1
+            found = index >= 0
 
-        if num_rows > -1:
-            data = data[-num_rows:]
+            if tolerance is not None:
+                found &= dates - series_dates[np.maximum(index, 0)] <= tolerance
 
-        n = np.array(data)
+            matrix[row, found] = values[index[found]]
+        else:
+            index = np.searchsorted(series_dates, dates)
+            found = index < len(series_dates)
+            found[found] = series_dates[index[found]] == dates[found]
 
-        date = np.array(list(map(mdates.strpdate2num(dt_format), n[:, 0])))
-        growth = np.array(n[:, 1], dtype=int)
+            matrix[row, found] = values[index[found]]
 
-        return date, growth
+    return dates, _fill(matrix, fill)
 
 
 def autocorr(a: np.ndarray, b: np.ndarray, time_lag: int=0):
@@ -96,26 +141,319 @@ def autocorr(a: np.ndarray, b: np.ndarray, time_lag: int=0):
     return np.corrcoef(np.array(a[time_lag:]), np.array(b[:len(b)-time_lag]))[0, 1]
 
 
+def _fft_length(n: int) -> int:
+    """The smallest power of 2 that is at least n."""
+    return 1 << max(int(n) - 1, 0).bit_length()
+
+
+def cross_correlation(a: np.ndarray, b: np.ndarray, max_lag: int) -> np.ndarray:
+    """Returns the Pearson correlation between two series (or two stacks of series) for every time lag in
+       [-max_lag, max_lag] at once.
+
+    The lagged sums of products all come from one FFT, and the means and variances of the overlapping parts come from
+    cumulative sums, so the cost is O(n log n) however many lags there are. The correlation for lag k >= 0 is the same
+    as autocorr(a, b, k), and for lag -k the same as autocorr(b, a, k).
+
+    :param a: A numpy array of n values, or a 2-D array with one series of n values per row.
+    :param b: Another numpy array of n values, or a 2-D array with one series of n values per row. A single series
+        is compared against every row of the other argument.
+    :param max_lag: The largest time lag.
+    :return: A numpy array of correlations (one row per pair of series if either argument is 2-D). The order is the
+        most negative up to the most positive time lag. Lags that leave fewer than 2 overlapping values, or values
+        that don't vary, give nan.
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    stacked = a.ndim > 1 or b.ndim > 1
+
+    a, b = np.broadcast_arrays(np.atleast_2d(a), np.atleast_2d(b))
+    n = a.shape[1]
+    max_lag = abs(int(max_lag))
+
+    if b.shape[1] != n:
+        raise ValueError('Both series must have the same length, got %s and %s instead' % (a.shape[1], b.shape[1]))
+
+    # Correlations don't depend on the means, so remove them to keep the sums below well conditioned
+    a = a - a.mean(axis=1, keepdims=True)
+    b = b - b.mean(axis=1, keepdims=True)
+
+    # Zero padding to at least n + max_lag keeps the circular correlation from wrapping around
+    size = _fft_length(n + min(max_lag, n))
+    products = np.fft.irfft(np.fft.rfft(a, size) * np.conj(np.fft.rfft(b, size)), size)
+
+    lags = np.arange(-max_lag, max_lag + 1)
+    positive = lags >= 0
+    shift = np.abs(lags)
+    overlap = np.maximum(n - shift, 0)
+
+    # products[k] = sum a[t + k] * b[t] and products[-k] = sum a[t] * b[t + k]
+    sum_ab = products[:, lags % size]
+    sum_ab[:, overlap == 0] = 0.
+
+    def head_tail(values):
+        # Sums of the first and last n - |lag| values of each row, for every lag
+        total = np.zeros((values.shape[0], n + 1))
+        np.cumsum(values, axis=1, out=total[:, 1:])
+        head = total[:, overlap]
+        tail = total[:, -1:] - total[:, np.minimum(shift, n)]
+        return head, tail
+
+    # For lag k >= 0 the overlap is a[k:] with b[:n - k], otherwise a[:n - k] with b[k:]
+    a_head, a_tail = head_tail(a)
+    a2_head, a2_tail = head_tail(a * a)
+    b_head, b_tail = head_tail(b)
+    b2_head, b2_tail = head_tail(b * b)
+
+    sum_a = np.where(positive, a_tail, a_head)
+    sum_a2 = np.where(positive, a2_tail, a2_head)
+    sum_b = np.where(positive, b_head, b_tail)
+    sum_b2 = np.where(positive, b2_head, b2_tail)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        count = overlap.astype(float)
+        covariance = sum_ab - sum_a * sum_b / count
+        variance_a = np.maximum(sum_a2 - sum_a * sum_a / count, 0.)
+        variance_b = np.maximum(sum_b2 - sum_b * sum_b / count, 0.)
+        correlation = covariance / np.sqrt(variance_a * variance_b)
+
+    correlation[:, overlap < 2] = np.nan
+    correlation = np.clip(correlation, -1., 1.)
+
+    return correlation if stacked else correlation[0]
+
+
+@cached
 def autocorr_range(a: np.ndarray, b: np.ndarray, lag_range: int=0):
     """Returns correlations between two numpy arrays for the given time range. The lag range is a range of lags
-       to get the correlation for.
+       to get the correlation for (see cross_correlation).
 
-    :param a: A numpy array.
-    :param b: Another numpy array.
+    :param a: A numpy array, or a 2-D array with one series per row.
+    :param b: Another numpy array, or a 2-D array with one series per row.
     :param lag_range: A range of time lags to use.
     :return: A numpy array of correlations over the time lag interval. The order is the most negative up to the most
         positive time lag.
     """
-    if lag_range == 0:
-        return np.array([autocorr(a, b, 0)])
+    return cross_correlation(a, b, lag_range)
+
+
+def resample_indices(n: int, count: int, method: str='permutation', block_size: int=None,
+                     random: np.random.RandomState=None) -> np.ndarray:
+    """Draws the indices of several resamples of a series at once.
+
+    :param n: The length of the series.
+    :param count: The number of resamples.
+    :param method: "permutation" (every value shuffled) or "block" (circular block bootstrap, which keeps the
+        autocorrelation within each block).
+    :param block_size: The length of the blocks. Defaults to None, meaning n ** (1/3) rounded.
+    :param random: The random state. Defaults to None, meaning np.random.
+    :return: A 2-D np array of shape (count, n).
+    """
+    random = random or np.random
+
+    if method == 'permutation':
+        return np.argsort(random.random_sample((count, n)), axis=1)
 
-    time_range = abs(lag_range)
-    pos = np.array([autocorr(a, b, i) for i in range(time_range + 1)])
+    if method == 'block':
+        block_size = max(1, int(block_size or round(n ** (1. / 3.))))
+        starts = random.randint(0, n, (count, -(-n // block_size)))
+        return ((starts[:, :, None] + np.arange(block_size)) % n).reshape(count, -1)[:, :n]
+
+    raise ValueError('method must be one of "permutation" or "block", got %s instead' % method)
+
+
+def _null_correlations(args: tuple) -> np.ndarray:
+    a, b, lag_range, method, block_size, seed, batch, count = args
+
+    random = np.random.RandomState([seed, batch])
+    indices = resample_indices(len(b), count, method, block_size, random)
+
+    return cross_correlation(a, b[indices], lag_range)
+
+
+def correlation_significance(a: np.ndarray, b: np.ndarray, lag_range: int=0, resamples: int=1000,
+                             method: str='permutation', block_size: int=None, confidence: float=0.95,
+                             seed: int=0, processes: int=None) -> Significance:
+    """Tests the correlations of autocorr_range against resamples of b that have no relationship with a.
+
+    The resamples are drawn in batches as index matrices and correlated for every lag at once with cross_correlation,
+    optionally across a process pool.
+
+    :param a: A numpy array.
+    :param b: Another numpy array of the same length.
+    :param lag_range: A range of time lags to use.
+    :param resamples: The number of resamples.
+    :param method: "permutation" or "block" (see resample_indices). Block resamples keep the autocorrelation of b, so
+        they don't overstate the significance of trending series.
+    :param block_size: The block length for "block". Defaults to None, meaning n ** (1/3) rounded.
+    :param confidence: The share of resampled correlations inside the band.
+    :param seed: The random seed. The same seed gives the same result however many processes are used.
+    :param processes: The number of worker processes. Defaults to None, meaning everything runs in this process.
+    :return: A Significance with an np array per lag (most negative up to most positive lag) of:
+        the correlation;
+        the two-sided p-value;
+        the p-value adjusted for testing every lag, from the largest resampled correlation over all lags (each scaled
+            by the square root of its overlap);
+        the lower and upper bounds of the band.
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    lag_range = abs(int(lag_range))
 
-    a, b = b, a
-    neg = np.array([autocorr(a, b, i) for i in reversed(range(1, time_range + 1))])
+    correlation = autocorr_range(a, b, lag_range)
 
-    return np.concatenate((neg, pos))
+    batch_size = max(1, _RESAMPLE_BATCH_VALUES // (2 * _fft_length(2 * len(b))))
+    batches = [(a, b, lag_range, method, block_size, seed, i, min(batch_size, resamples - start))
+               for i, start in enumerate(range(0, resamples, batch_size))]
+
+    if processes is None or processes <= 1:
+        null = np.concatenate([_null_correlations(batch) for batch in batches])
+    else:
+        with Pool(processes) as pool:
+            null = np.concatenate(pool.map(_null_correlations, batches))
+
+    # Lags with little overlap reach large correlations by chance, so the adjusted p-values compare correlations scaled
+    # by the square root of their overlap (roughly standard normal for unrelated series)
+    scale = np.sqrt(np.maximum(len(b) - np.abs(np.arange(-lag_range, lag_range + 1)), 1))
+
+    observed = np.abs(correlation)
+    with np.errstate(invalid='ignore'):
+        extreme = np.sum(np.abs(null) >= observed, axis=0)
+        extreme_any = np.sum(np.nanmax(np.abs(null) * scale, axis=1)[:, None] >= observed * scale, axis=0)
+
+    tail = 50. * (1. - confidence)
+    lower, upper = np.nanpercentile(null, [tail, 100. - tail], axis=0)
+
+    return Significance(correlation, (1. + extreme) / (1. + resamples), (1. + extreme_any) / (1. + resamples),
+                        lower, upper)
+
+
+def _lagged_pairs(a: np.ndarray, b: np.ndarray, time_lag: int) -> tuple:
+    """Lines up a[t + time_lag] with b[t] (see autocorr), negative lags pairing a[t] with b[t - time_lag]."""
+    if time_lag >= 0:
+        return a[time_lag:], b[:len(b) - time_lag]
+
+    return a[:len(a) + time_lag], b[-time_lag:]
+
+
+def rolling_correlation(a: np.ndarray, b: np.ndarray, window: int, time_lag: int=0) -> np.ndarray:
+    """Returns the correlation between two numpy arrays over a rolling window, for the given time lag.
+
+    The windowed sums come from differences of cumulative sums, so every window costs O(1).
+
+    :param a: A numpy array.
+    :param b: Another numpy array of the same length.
+    :param window: The number of (lagged) pairs in each window.
+    :param time_lag: The time lag (see autocorr).
+    :return: A numpy array as long as a. Element i is the correlation of the window of pairs whose later value is at
+        index i, so it only uses data up to i. The first window - 1 + abs(time_lag) values are nan.
+    """
+    if window < 2:
+        raise ValueError('window must be at least 2, got %s instead' % window)
+
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+
+    if len(a) != len(b):
+        raise ValueError('Both series must have the same length, got %s and %s instead' % (len(a), len(b)))
+
+    correlation = np.full(len(a), np.nan)
+    x, y = _lagged_pairs(a, b, time_lag)
+
+    if len(x) < window:
+        return correlation
+
+    # Correlations don't depend on the means, so remove them to keep the running sums small
+    x = x - x.mean()
+    y = y - y.mean()
+
+    def windowed(values):
+        total = np.concatenate(([0.], np.cumsum(values)))
+        return total[window:] - total[:-window]
+
+    sum_x, sum_y = windowed(x), windowed(y)
+    covariance = windowed(x * y) - sum_x * sum_y / window
+    variance_x = np.maximum(windowed(x * x) - sum_x * sum_x / window, 0.)
+    variance_y = np.maximum(windowed(y * y) - sum_y * sum_y / window, 0.)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correlation[window - 1 + abs(time_lag):] = np.clip(covariance / np.sqrt(variance_x * variance_y), -1., 1.)
+
+    return correlation
+
+
+class RollingCorrelation:
+    """Rolling correlation between two series that is updated one pair of values at a time.
+
+    Matches rolling_correlation (the same window and time lag) at every index; before the window is full the value is
+    nan.
+    """
+
+    def __init__(self, window: int, time_lag: int=0):
+        if window < 2:
+            raise ValueError('window must be at least 2, got %s instead' % window)
+
+        self.window = window
+        self.time_lag = time_lag
+        self.value = np.nan
+        self._delayed = deque(maxlen=abs(time_lag) + 1)
+        self._pairs = deque(maxlen=window)
+        self._shift = None
+        self._sums = np.zeros(5)  # x, y, x * x, y * y, x * y
+        self._updates = 0
+
+    @staticmethod
+    def _terms(x: float, y: float) -> np.ndarray:
+        return np.array([x, y, x * x, y * y, x * y])
+
+    def update(self, a: float, b: float) -> float:
+        """Adds the next value of each series.
+
+        :param a: The new value of the first series.
+        :param b: The new value of the second series.
+        :return: The updated correlation (nan until the window is full).
+        """
+        a, b = float(a), float(b)
+
+        # The first values are subtracted from everything to keep the running sums small
+        if self._shift is None:
+            self._shift = (a, b)
+        a, b = a - self._shift[0], b - self._shift[1]
+
+        # Hold back the series that lags until its paired value arrives
+        self._delayed.append(b if self.time_lag >= 0 else a)
+        if len(self._delayed) < self._delayed.maxlen:
+            return self.value
+
+        pair = (a, self._delayed[0]) if self.time_lag >= 0 else (self._delayed[0], b)
+
+        if len(self._pairs) == self.window:
+            self._sums -= self._terms(*self._pairs[0])
+
+        self._pairs.append(pair)
+        self._sums += self._terms(*pair)
+        self._updates += 1
+
+        # Re-sum the window every so often so the running sums don't drift
+        if self._updates % self.window == 0:
+            self._sums = np.sum([self._terms(*p) for p in self._pairs], axis=0)
+
+        if len(self._pairs) == self.window:
+            sum_x, sum_y, sum_xx, sum_yy, sum_xy = self._sums
+            covariance = sum_xy - sum_x * sum_y / self.window
+            variance = max(sum_xx - sum_x * sum_x / self.window, 0.) * max(sum_yy - sum_y * sum_y / self.window, 0.)
+
+            self.value = min(max(covariance / np.sqrt(variance), -1.), 1.) if variance > 0 else np.nan
+
+        return self.value
+
+    def update_batch(self, a, b) -> np.ndarray:
+        """Adds the next values of each series.
+
+        :param a: The new values of the first series.
+        :param b: The new values of the second series.
+        :return: An np array of the correlation after each pair of values.
+        """
+        return np.array([self.update(x, y) for x, y in zip(a, b)], dtype=float)
 
 
 def change(a: np.ndarray, offset: int=1):
@@ -128,7 +466,7 @@ def percent_change(a: np.ndarray, offset: int=1):
     return np.diff(c, offset) / np.abs(c[:-1])
 
 
-def plot_correlation(values, lag_range: int, title: str=''):
+def plot_correlation(values, lag_range: int, title: str='', band: tuple=None):
     fig = plt.figure()
 
     ax1 = plt.subplot2grid((6, 4), (1, 0), rowspan=4, colspan=4)
@@ -138,6 +476,10 @@ def plot_correlation(values, lag_range: int, title: str=''):
     # Plot points
     ax1.plot(x, values, label='correlation', linewidth=1.5)
 
+    # Band of correlations that aren't significant
+    if band is not None:
+        ax1.fill_between(x, band[0], band[1], color='grey', alpha=0.3, label='not significant')
+
     # Grid
     ax1.grid(True)
     ax1.tick_params(axis='y')
@@ -153,21 +495,16 @@ def plot_correlation(values, lag_range: int, title: str=''):
 
 
 if __name__ == '__main__':
-    # The two data arrays need to be on the same time interval for this to make sense
-    # (which I've conveniently done in the data).
-    data = read_currency_file('../data/bitcoin_coinmarketcap.csv', {
-        'date': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5
-    }, num_rows=50)
-
-    date, btc_open_price, _, _, _, _ = data
-
-    data = read_currency_file('../data/ethereum_coinmarketcap.csv', {
-        'date': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5
-    }, num_rows=50)
+    column_map = {'date': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5}
 
-    _, eth_open_price, _, _, _, _ = data
+    btc_date, btc_open_price, _, _, _, _ = read_currency_file('../data/bitcoin_coinmarketcap.csv', column_map)
+    eth_date, eth_open_price, _, _, _, _ = read_currency_file('../data/ethereum_coinmarketcap.csv', column_map)
+    reddit_date, reddit_growth = read_subscriber_file('../data/bitcoin.subscriber.csv')
 
-    _, reddit_growth = read_subscriber_file('../data/bitcoin.subscriber.csv', num_rows=50)
+    # Only keep the dates all three series have
+    date, (btc_open_price, eth_open_price, reddit_growth) = align_series([
+        (btc_date, btc_open_price), (eth_date, eth_open_price), (reddit_date, reddit_growth)
+    ], how='inner')
 
     # Percent change
     btc_open_price_pc = percent_change(btc_open_price)
@@ -176,26 +513,20 @@ if __name__ == '__main__':
 
     # Calculate correlation
     lag_range = 10
-    btc_eth_correlation = autocorr_range(btc_open_price_pc, eth_open_price_pc, lag_range)
-    btc_reddit_correlation = autocorr_range(btc_open_price_pc, reddit_growth_pc, lag_range)
+    btc_eth = correlation_significance(btc_open_price_pc, eth_open_price_pc, lag_range, 10000, method='block')
+    btc_reddit = correlation_significance(btc_open_price_pc, reddit_growth_pc, lag_range, 10000, method='block')
 
     # Plot results
     lags = np.array(list(range(-lag_range, lag_range + 1)))
 
-    plot_correlation(btc_eth_correlation, lag_range, 'BTC v. ETH')
-
-    cat = [(lags[i], btc_eth_correlation[i]) for i in range(lag_range * 2 + 1)]
-    cat_sort = sorted(cat, key=lambda x: abs(x[1]), reverse=True)
-
-    print('BTC v. ETH')
-    for lag, correlation in cat_sort:
-        print('Lag: %s\tCorrelation: %s' % (lag, correlation))
-
-    plot_correlation(btc_reddit_correlation, lag_range, 'BTC v. Reddit Growth')
+    for title, significance in (('BTC v. ETH', btc_eth), ('BTC v. Reddit Growth', btc_reddit)):
+        plot_correlation(significance.correlation, lag_range, title, (significance.lower, significance.upper))
 
-    cat = [(lags[i], btc_reddit_correlation[i]) for i in range(lag_range * 2 + 1)]
-    cat_sort = sorted(cat, key=lambda x: abs(x[1]), reverse=True)
+        cat = [(lags[i], significance.correlation[i], significance.p_values[i], significance.adjusted_p_values[i])
+               for i in range(lag_range * 2 + 1)]
+        cat_sort = sorted(cat, key=lambda x: abs(x[1]), reverse=True)
 
-    print('BTC v. Reddit Growth')
-    for lag, correlation in cat_sort:
-        print('Lag: %s\tCorrelation: %s' % (lag, correlation))
+        print(title)
+        for lag, correlation, p_value, adjusted_p_value in cat_sort:
+            print('Lag: %s\tCorrelation: %s\tp: %.4f\tp (all lags): %.4f' % (lag, correlation, p_value,
+                                                                          adjusted_p_value))
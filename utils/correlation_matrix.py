@@ -0,0 +1,245 @@
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import matplotlib.dates as mdates
+import pandas as pd
+
+from correlation import _fft_length, align_series, percent_change, read_currency_file, read_subscriber_file
+
+COINMARKETCAP_COLUMNS = {'date': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5}
+
+SENTIMENT_TONES = ['sad', 'frustrated', 'satisfied', 'excited', 'polite', 'impolite', 'sympathetic']
+
+# Largest number of bytes of spectrum products a block of pairs may use at once
+_BLOCK_BYTES = 2 ** 27
+
+_shared = {}
+
+
+def read_sentiment_file(file_path: str) -> dict:
+    """Reads a tone csv written by twitterscrape.py and averages each tone per day.
+
+    :param file_path: The path of the file.
+    :return: A dict of tone name to tuple of np arrays (date, mean score).
+    """
+    if not os.path.exists(file_path) or not os.path.isfile(file_path):
+        raise FileNotFoundError('File %s does not exist!' % file_path)
+
+    df = pd.read_csv(file_path, usecols=['timestamp'] + SENTIMENT_TONES)
+    daily = df[SENTIMENT_TONES].groupby(pd.to_datetime(df['timestamp']).dt.normalize()).mean()
+    dates = mdates.date2num(daily.index.values)
+
+    return {tone: (dates, daily[tone].values) for tone in SENTIMENT_TONES}
+
+
+def load_series(coin_directory: str='../data/coinmarketcap', subscriber_path: str='../data/bitcoin.subscriber.csv',
+                sentiment_paths: tuple=()) -> dict:
+    """Loads the daily changes of every series to correlate: the closing price of each coin, the subreddit subscriber
+       growth and the tones of any sentiment files. Prices and growth become percent changes, and sentiment scores
+       (which are already between 0 and 1) become plain differences.
+
+    :param coin_directory: A directory of coinmarketcap csv files. Can be None.
+    :param subscriber_path: A subscriber growth csv file. Can be None.
+    :param sentiment_paths: Tone csv files written by twitterscrape.py.
+    :return: A dict of series name to tuple of np arrays (date, change). The dates are those of the later value of
+        each change.
+    """
+    series = {}
+
+    if coin_directory is not None:
+        if not os.path.exists(coin_directory) or not os.path.isdir(coin_directory):
+            raise FileNotFoundError('Directory %s does not exist!' % coin_directory)
+
+        for name in sorted(os.listdir(coin_directory)):
+            if name.endswith('.csv'):
+                date, _, _, _, close_price, _ = read_currency_file(os.path.join(coin_directory, name),
+                                                                    COINMARKETCAP_COLUMNS)
+                series[os.path.splitext(name)[0]] = (date[1:], percent_change(close_price))
+
+    if subscriber_path is not None:
+        date, growth = read_subscriber_file(subscriber_path)
+        series['reddit_growth'] = (date[1:], percent_change(growth.astype(float)))
+
+    for file_path in sentiment_paths:
+        prefix = os.path.splitext(os.path.basename(file_path))[0]
+        for tone, (date, score) in read_sentiment_file(file_path).items():
+            series['%s_%s' % (prefix, tone)] = (date[1:], np.diff(score))
+
+    return series
+
+
+def _spectra(matrix: np.ndarray, size: int) -> np.ndarray:
+    """The spectra of the centered values, their squares and the masks of each row, with missing values as zeros.
+
+    :return: A complex np array of shape (rows, 3, size // 2 + 1).
+    """
+    valid = np.isfinite(matrix)
+
+    with np.errstate(invalid='ignore'):
+        counts = valid.sum(axis=1, keepdims=True)
+        means = np.where(valid, matrix, 0.).sum(axis=1, keepdims=True) / np.maximum(counts, 1)
+
+    values = np.where(valid, matrix - means, 0.)
+
+    return np.stack([np.fft.rfft(values, size), np.fft.rfft(values * values, size),
+                     np.fft.rfft(valid.astype(float), size)], axis=1)
+
+
+def _correlate_block(block: tuple) -> tuple:
+    """Computes the lagged correlations of a block of row pairs from the spectra in _shared.
+
+    :param block: A tuple of (first row, last row, first column, last column), end exclusive.
+    :return: A tuple of (block, correlations of shape (rows, columns, lags), overlapping counts of the same shape).
+    """
+    row_start, row_end, column_start, column_end = block
+    spectra, size, max_lag, min_periods = (_shared['spectra'], _shared['size'], _shared['max_lag'],
+                                           _shared['min_periods'])
+
+    rows = spectra[row_start:row_end, :, None, :]
+    columns = np.conj(spectra[None, column_start:column_end, :, :])
+    lags = np.arange(-max_lag, max_lag + 1) % size
+
+    def lagged(row_part, column_part):
+        # sum over t of row[t + k] * column[t] for every lag k, masked values being zeros
+        return np.fft.irfft(rows[:, row_part] * columns[:, :, column_part], size)[:, :, lags]
+
+    values, squares, mask = 0, 1, 2
+    count = np.round(lagged(mask, mask))
+    sum_ab = lagged(values, values)
+    sum_a, sum_a2 = lagged(values, mask), lagged(squares, mask)
+    sum_b, sum_b2 = lagged(mask, values), lagged(mask, squares)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = sum_ab - sum_a * sum_b / count
+        variance_a = np.maximum(sum_a2 - sum_a * sum_a / count, 0.)
+        variance_b = np.maximum(sum_b2 - sum_b * sum_b / count, 0.)
+        correlation = np.clip(covariance / np.sqrt(variance_a * variance_b), -1., 1.)
+
+    correlation[count < max(min_periods, 2)] = np.nan
+
+    return block, correlation, count
+
+
+def _share(shared: dict):
+    _shared.update(shared)
+
+
+def _blocks(rows: int, block_size: int) -> list:
+    """Splits the pairs (i, j) with i <= j into square blocks of rows and columns."""
+    starts = range(0, rows, block_size)
+
+    return [(i, min(i + block_size, rows), j, min(j + block_size, rows)) for i in starts for j in starts if j >= i]
+
+
+def _map_blocks(shared: dict, blocks: list, processes: int=None):
+    """Yields the results of _correlate_block for every block, optionally spread across a process pool."""
+    if processes is None or processes <= 1:
+        _share(shared)
+        try:
+            for block in blocks:
+                yield _correlate_block(block)
+        finally:
+            _shared.clear()
+    else:
+        with Pool(processes, initializer=_share, initargs=(shared,)) as pool:
+            for result in pool.imap_unordered(_correlate_block, blocks):
+                yield result
+
+
+def correlation_matrix(names: list, matrix: np.ndarray, max_lag: int, top: int=50, min_periods: int=30,
+                       processes: int=None, block_size: int=None, tensor_path: str=None) -> tuple:
+    """Computes the Pearson correlation of every pair of series for every time lag in [-max_lag, max_lag], using only
+       the dates where both series have a value.
+
+    The lagged sums for a block of pairs come from FFTs of each series, its squares and its mask of valid values (see
+    correlation.cross_correlation), so each pair costs O(n log n) however many lags there are. Blocks are sized so their
+    spectrum products stay under _BLOCK_BYTES, and only the blocks with i <= j are computed.
+
+    :param names: The names of the series.
+    :param matrix: A 2-D np array with one aligned series per row and nan for missing values (see
+        correlation.align_series with how='outer').
+    :param max_lag: The largest time lag.
+    :param top: The number of relationships to keep.
+    :param min_periods: The smallest number of overlapping values a correlation is computed from (others are nan).
+    :param processes: The number of worker processes. Defaults to None, meaning everything runs in this process.
+    :param block_size: The number of series per block. Defaults to None, meaning it is derived from _BLOCK_BYTES.
+    :param tensor_path: A .npy file to write the tensor to (memory-mapped, so it doesn't have to fit in memory).
+        Defaults to None, meaning the tensor is kept in memory.
+    :return: A tuple of (tensor, relationships).
+        The tensor has shape (series, series, 2 * max_lag + 1). Element [i, j, max_lag + k] is the correlation
+        between series i and series j shifted k values later, so a high value for k > 0 means j leads i by k.
+        The relationships data frame has the top lead/lag relationship of each pair. A pair's top relationship is its
+        nonzero lag with the largest absolute correlation. Columns are leader, follower, lag (how far the follower
+        trails the leader), correlation and overlap. Rows are sorted by absolute correlation.
+    """
+    rows, n = matrix.shape
+    max_lag = abs(int(max_lag))
+    lag_count = 2 * max_lag + 1
+
+    if max_lag == 0:
+        raise ValueError('max_lag must be at least 1, got %s instead' % max_lag)
+
+    size = _fft_length(n + min(max_lag, n))
+
+    if block_size is None:
+        block_size = max(1, int(np.sqrt(_BLOCK_BYTES / (16. * (size // 2 + 1)))))
+
+    if tensor_path is None:
+        tensor = np.full((rows, rows, lag_count), np.nan)
+    else:
+        tensor = np.lib.format.open_memmap(tensor_path, mode='w+', dtype=np.float64, shape=(rows, rows, lag_count))
+
+    shared = {'spectra': _spectra(matrix, size), 'size': size, 'max_lag': max_lag, 'min_periods': min_periods}
+    candidates = []
+    nonzero = np.arange(-max_lag, max_lag + 1) != 0
+
+    for (i0, i1, j0, j1), correlation, count in _map_blocks(shared, _blocks(rows, block_size), processes):
+        tensor[i0:i1, j0:j1] = correlation
+        tensor[j0:j1, i0:i1] = correlation[:, :, ::-1].transpose(1, 0, 2)
+
+        strength = np.where(np.isnan(correlation[:, :, nonzero]), -1., np.abs(correlation[:, :, nonzero]))
+        best = np.flatnonzero(nonzero)[np.argmax(strength, axis=2)]
+
+        for i in range(i0, i1):
+            for j in range(max(j0, i + 1), j1):
+                k = best[i - i0, j - j0]
+                if not np.isnan(correlation[i - i0, j - j0, k]):
+                    lag = k - max_lag
+                    leader, follower = (names[j], names[i]) if lag > 0 else (names[i], names[j])
+                    candidates.append((leader, follower, abs(lag), correlation[i - i0, j - j0, k],
+                                       int(count[i - i0, j - j0, k])))
+
+    if isinstance(tensor, np.memmap):
+        tensor.flush()
+
+    relationships = pd.DataFrame(candidates, columns=['leader', 'follower', 'lag', 'correlation', 'overlap'])
+    relationships = relationships.reindex(relationships['correlation'].abs().sort_values(ascending=False).index)
+
+    return tensor, relationships.head(top).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    # Usage: correlation_matrix.py [output directory] [sentiment csv files...] [processes=<n>]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('processes=')]
+    processes = ([int(arg[len('processes='):]) for arg in sys.argv[1:] if arg.startswith('processes=')] or [None])[-1]
+    output_directory = args[0] if len(args) > 0 else '.'
+    lag_range = 30
+
+    series = load_series(sentiment_paths=args[1:])
+    names = list(series)
+    dates, matrix = align_series([series[name] for name in names], how='outer')
+
+    start = time.perf_counter()
+    tensor, relationships = correlation_matrix(names, matrix, lag_range, top=50, processes=processes,
+                                               tensor_path=os.path.join(output_directory, 'correlation_tensor.npy'))
+    print('Correlated %s series over %s dates and %s lags in %.2fs' %
+          (len(names), len(dates), 2 * lag_range + 1, time.perf_counter() - start))
+
+    with open(os.path.join(output_directory, 'correlation_series.txt'), 'w') as file:
+        file.write('\n'.join(names) + '\n')
+
+    relationships.to_csv(os.path.join(output_directory, 'correlation_relationships.csv'), index=False)
+    print(relationships.to_string())
@@ -1,9 +1,23 @@
 # Aggregates data sets from the following: https://www.cryptodatasets.com/platforms/Bitfinex/BTC/
 # Assumes data exists in a local directory
 
+import hashlib
+import json
 import os, sys
+import struct
+import time as clock
+from collections import namedtuple
 from datetime import datetime, timedelta
 from enum import Enum
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 
 class Interval(Enum):
@@ -12,6 +26,37 @@ class Interval(Enum):
     Minute = 2
 
 
+INTERVAL_SECONDS = {Interval.Day: 86400, Interval.Hour: 3600, Interval.Minute: 60}
+
+# A bar of ticks. time is the start of the interval in wall-clock epoch seconds (the timestamps of the files read as if
+# they were UTC); sum and count give the mean price and let bars of the same interval be combined exactly.
+BAR_DTYPE = np.dtype([('time', np.int64), ('open', np.float64), ('high', np.float64), ('low', np.float64),
+                      ('close', np.float64), ('sum', np.float64), ('count', np.int64), ('volume', np.float64)])
+
+# Size of the header of the .npy files written by write_npy, fixed so it can be rewritten in place
+NPY_HEADER_SIZE = 256
+
+# How the mean price of an interval without ticks is filled in: with 0.0, the previous mean, nan, or linearly between
+# the means around it
+FILL_POLICIES = ('zero', 'ffill', 'nan', 'interpolate')
+
+# Ticks parsed per chunk by read_ticks
+CHUNK_SIZE = 10 ** 6
+
+# Largest number of bars fill_gaps creates at once
+GAP_BLOCK_SIZE = 10 ** 6
+
+# Number of bytes at the end of the aggregated part of a file that aggregate_incremental hashes
+MANIFEST_HASH_BYTES = 2 ** 16
+
+# Throughput and memory use of aggregate_stream. peak_rss is the peak resident set size of the process in MB.
+StreamStats = namedtuple('StreamStats', ['ticks', 'bars', 'seconds', 'ticks_per_second', 'peak_rss'])
+
+
+class OutOfOrderError(ValueError):
+    """Raised by stream_bars when ticks go back in time across chunks or files, into bars already handed on."""
+
+
 def interval_format(interval: Interval) -> str:
     if interval == Interval.Day:
         return '%Y-%m-%d'
@@ -25,137 +70,925 @@ def interval_format(interval: Interval) -> str:
     raise ValueError('Invalid interval %s given!' % interval.name)
 
 
-def create_point(time: datetime, amount: float, interval: Interval, human_readable: bool = False) -> tuple:
-    formatted = time.strftime(interval_format(interval))
+class _ByteRange:
+    """A binary file that ends early, for reading part of a csv."""
+
+    def __init__(self, file, end: int):
+        self.file = file
+        self.end = end
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = max(self.end - self.file.tell(), 0)
+
+        return self.file.read(remaining if size is None or size < 0 else min(size, remaining))
 
-    if human_readable:
-        return formatted, amount
+    def __iter__(self):
+        while True:
+            line = self.file.readline(max(self.end - self.file.tell(), 0))
+            if not line:
+                break
+            yield line
+
+
+def read_ticks(file_path: str, chunk_size: int=CHUNK_SIZE, start: int=0, end: int=None):
+    """Reads a Bitfinex trade csv (timestamp,amount,price with a header) in chunks, parsing every timestamp of a chunk
+       at once. Fractions of seconds are dropped. Files ending in .gz or .bz2 are decompressed on the fly.
+
+    :param file_path: The path of the file.
+    :param chunk_size: The number of ticks per chunk.
+    :param start: The byte offset of the first line to read (0 is the header). Only for uncompressed files.
+    :param end: The byte offset to stop reading at (the end of a line). Defaults to None, meaning the end of the file.
+    :return: A generator of tuples of np arrays (wall-clock epoch seconds, price, amount).
+    """
+    if not os.path.exists(file_path) or not os.path.isfile(file_path):
+        raise FileNotFoundError('File %s does not exist!' % file_path)
+
+    names = ['timestamp', 'amount', 'price']
+    dtype = {'timestamp': str, 'amount': np.float64, 'price': np.float64}
+
+    file = None
+    if start == 0 and (end is None or end == os.path.getsize(file_path)):
+        chunks = pd.read_csv(file_path, header=0, names=names, chunksize=chunk_size, dtype=dtype, compression='infer')
     else:
-        return datetime.strptime(formatted, interval_format(interval)).timestamp(), amount
+        file = open(file_path, 'rb')
+        file.seek(start)
+        chunks = pd.read_csv(_ByteRange(file, end if end is not None else os.path.getsize(file_path)),
+                             header=0 if start == 0 else None, names=names, chunksize=chunk_size, dtype=dtype)
 
+    try:
+        for chunk in chunks:
+            # Some of the files have fractions of seconds, so only the first 19 characters (%Y-%m-%d %H:%M:%S) are
+            # parsed
+            times = chunk['timestamp'].values.astype('U19').astype('datetime64[s]').astype(np.int64)
 
-def generate_missing_points(current_time: datetime, previous_time: datetime, interval: Interval, human_readable: bool = False) -> list:
-    time = previous_time
+            yield times, chunk['price'].values, chunk['amount'].values
+    finally:
+        if file is not None:
+            file.close()
 
-    data = []
 
-    while not is_same_interval(time, current_time, interval):
-        formatted = time.strftime(interval_format(interval))
+def bucket_ticks(times: np.ndarray, prices: np.ndarray, amounts: np.ndarray, interval: Interval) -> np.ndarray:
+    """Groups ticks into bars. Ticks are expected in time order; out of order ticks are sorted first.
 
-        if human_readable:
-            data.append((formatted, 0.0))
-        else:
-            data.append((datetime.strptime(formatted, interval_format(interval)).timestamp(), 0.0))
+    :param times: The wall-clock epoch seconds of the ticks.
+    :param prices: The prices of the ticks.
+    :param amounts: The amounts of the ticks (sells are negative). The volume of a bar is the sum of their sizes.
+    :param interval: The interval of the bars.
+    :return: An np array of BAR_DTYPE, one per interval with ticks, sorted by time.
+    """
+    if len(times) == 0:
+        return np.zeros(0, dtype=BAR_DTYPE)
 
-        time = increment_datetime(time, interval)
+    buckets = times - times % INTERVAL_SECONDS[interval]
 
-    return data
+    if np.any(buckets[1:] < buckets[:-1]):
+        order = np.argsort(times, kind='mergesort')
+        buckets, prices, amounts = buckets[order], prices[order], amounts[order]
 
+    starts = np.concatenate(([0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1))
+    ends = np.append(starts[1:], len(buckets))
 
-def is_same_interval(previous: datetime, current: datetime, interval: Interval) -> bool:
-    if interval == Interval.Day:
-        return previous.day == current.day
+    bars = np.empty(len(starts), dtype=BAR_DTYPE)
+    bars['time'] = buckets[starts]
+    bars['open'] = prices[starts]
+    bars['high'] = np.maximum.reduceat(prices, starts)
+    bars['low'] = np.minimum.reduceat(prices, starts)
+    bars['close'] = prices[ends - 1]
+    bars['sum'] = np.add.reduceat(prices, starts)
+    bars['count'] = ends - starts
+    bars['volume'] = np.add.reduceat(np.abs(amounts), starts)
 
-    if interval == Interval.Hour:
-        return previous.hour == current.hour
+    return bars
 
-    if interval == Interval.Minute:
-        return previous.minute == current.minute
 
+def combine_bars(bars: np.ndarray) -> np.ndarray:
+    """Combines bars of the same interval (e.g. the partial bars at the edges of chunks or files) exactly.
+
+    :param bars: An np array of BAR_DTYPE sorted by time, where bars with the same time are in tick order.
+    :return: An np array of BAR_DTYPE with one bar per time.
+    """
+    if len(bars) < 2 or np.all(bars['time'][1:] != bars['time'][:-1]):
+        return bars
+
+    starts = np.concatenate(([0], np.flatnonzero(bars['time'][1:] != bars['time'][:-1]) + 1))
+    ends = np.append(starts[1:], len(bars))
+
+    combined = np.empty(len(starts), dtype=BAR_DTYPE)
+    combined['time'] = bars['time'][starts]
+    combined['open'] = bars['open'][starts]
+    combined['high'] = np.maximum.reduceat(bars['high'], starts)
+    combined['low'] = np.minimum.reduceat(bars['low'], starts)
+    combined['close'] = bars['close'][ends - 1]
+
+    for field in ('sum', 'count', 'volume'):
+        combined[field] = np.add.reduceat(bars[field], starts)
+
+    return combined
+
+
+def merge_bars(parts: list) -> np.ndarray:
+    """Merges several arrays of bars (e.g. of consecutive chunks or files) into one, combining bars of the same
+       interval.
+
+    :param parts: A list of np arrays of BAR_DTYPE, in tick order.
+    :return: An np array of BAR_DTYPE sorted by time.
+    """
+    if len(parts) == 0:
+        return np.zeros(0, dtype=BAR_DTYPE)
+
+    bars = np.concatenate(parts)
+
+    # Parts are only out of order if the ticks are
+    if np.any(bars['time'][1:] < bars['time'][:-1]):
+        bars = bars[np.argsort(bars['time'], kind='mergesort')]
+
+    return combine_bars(bars)
+
+
+def aggregate_ticks(file_path: str, interval: Interval, chunk_size: int=CHUNK_SIZE) -> np.ndarray:
+    """Aggregates a Bitfinex trade csv into bars, a chunk of ticks at a time.
+
+    :param file_path: The path of the file.
+    :param interval: The interval of the bars.
+    :param chunk_size: The number of ticks per chunk.
+    :return: An np array of BAR_DTYPE sorted by time.
+    """
+    return merge_bars([bucket_ticks(times, prices, amounts, interval)
+                       for times, prices, amounts in read_ticks(file_path, chunk_size)])
+
+
+def _local_epoch(times: np.ndarray) -> np.ndarray:
+    """Converts wall-clock epoch seconds to real epoch seconds in the local timezone, the way datetime.timestamp() does
+       for naive datetimes. Offsets only change on the hour, so mktime is called once per distinct hour.
+    """
+    hours, codes = np.unique(times - times % 3600, return_inverse=True)
+    offsets = np.array([clock.mktime(clock.gmtime(int(hour))[:8] + (-1,)) - hour for hour in hours])
+
+    return times + offsets[codes.reshape(-1)]
+
+
+def format_times(times: np.ndarray, interval: Interval, human_readable: bool=False) -> np.ndarray:
+    """Formats interval start times as epoch seconds (in the local timezone) or as strings in interval_format.
+
+    :param times: The wall-clock epoch seconds.
+    :param interval: The interval.
+    :param human_readable: Whether to format them as strings (see interval_format) instead of epoch seconds.
+    :return: An np array of strings or of floats.
+    """
+    if not human_readable:
+        return _local_epoch(times).astype(np.float64)
+
+    times = times.astype('datetime64[s]')
 
-def increment_datetime(dt: datetime, interval: Interval) -> datetime:
     if interval == Interval.Day:
-        return dt + timedelta(days=1)
+        return np.datetime_as_string(times, unit='D')
 
-    if interval == Interval.Hour:
-        return dt + timedelta(hours=1)
+    return np.char.replace(np.datetime_as_string(times, unit='s'), 'T', ' ')
 
-    if interval == Interval.Minute:
-        return dt + timedelta(minutes=1)
 
-    raise ValueError('Invalid interval %s given!' % interval.name)
+def fill_values(values: np.ndarray, empty: np.ndarray, fill: str = 'zero', previous: float = np.nan,
+                following: float = np.nan) -> np.ndarray:
+    """Fills in the values of the intervals without ticks in one go (see FILL_POLICIES).
 
+    :param values: An np array of values, one per interval.
+    :param empty: A boolean np array of which intervals had no ticks.
+    :param fill: The fill policy: "zero", "ffill", "nan" or "interpolate".
+    :param previous: The last value before these intervals, used by "ffill" and "interpolate" for leading gaps.
+    :param following: The first value after these intervals, used by "interpolate" for trailing gaps.
+    :return: A new np array of floats. Gaps without a value to fill from stay nan.
+    """
+    if fill not in FILL_POLICIES:
+        raise ValueError('fill must be one of %s, got %s instead' % (', '.join(FILL_POLICIES), fill))
 
-def join_duplicates(data: list):
-    i = 0
+    values = np.array(values, dtype=np.float64)
 
-    while i < len(data) - 1:
-        # Duplicate intervals... aggregate
-        if data[i][0] == data[i][1]:
-            data[i][0] += data[i][1]
-            data[i][0] /= 2
-            data.pop(1)
-        else:
-            i += 1
+    if not np.any(empty):
+        return values
 
+    if fill == 'zero':
+        values[empty] = 0.
+    elif fill == 'nan':
+        values[empty] = np.nan
+    elif fill == 'ffill':
+        last = np.maximum.accumulate(np.where(empty, -1, np.arange(len(values))))[empty]
+        values[empty] = np.where(last >= 0, values[last], previous)
+    else:
+        present = np.flatnonzero(~empty)
+        values[empty] = np.interp(np.flatnonzero(empty), np.concatenate(([-1], present, [len(values)])),
+                                  np.concatenate(([previous], values[present], [following])))
 
-def aggregate_file(file_path: str, start_date: datetime, interval: Interval, human_readable: bool = False) -> tuple:
-    if not os.path.exists(file_path) or not os.path.isfile(file_path):
-        raise FileNotFoundError('File %s does not exist!' % file_path)
+    return values
+
+
+def fill_points(bar_blocks, fill: str = 'zero', state: dict = None):
+    """Computes the mean price of each bar of dense blocks of bars (see fill_gaps), filling the empty ones in with a
+       policy. With "interpolate", empty bars at the end of a block are held back until a bar with ticks follows.
+
+    :param bar_blocks: An iterable of np arrays of BAR_DTYPE, each sorted by time and after the previous one.
+    :param fill: The fill policy (see FILL_POLICIES).
+    :param state: A dict to carry the last mean between calls (under "previous"). Defaults to None.
+    :return: A generator of tuples of (np array of BAR_DTYPE, np array of means).
+    """
+    previous = np.nan if state is None else state.get('previous', np.nan)
+    held = np.zeros(0, dtype=BAR_DTYPE)
 
-    data = []
+    for bars in bar_blocks:
+        if fill == 'interpolate' and len(held):
+            bars = np.concatenate((held, bars))
 
-    previous_time = start_date
-    current_time = previous_time
-    interval_count, interval_sum = 0, 0.0
-    first_line = True  # Skip header
+        empty = bars['count'] == 0
+        present = np.flatnonzero(~empty)
 
-    with open(file_path, 'r') as file:
-        for line in file:
-            if first_line:
-                first_line = False
+        if fill == 'interpolate':
+            end = present[-1] + 1 if len(present) else 0
+            bars, held, empty = bars[:end], bars[end:], empty[:end]
+
+            if len(bars) == 0:
                 continue
 
-            timestamp, _, price = line.rstrip('\n').split(',')
-            price = float(price)
+        means = np.full(len(bars), np.nan)
+        np.divide(bars['sum'], bars['count'], out=means, where=~empty)
 
-            # Some of the files use different timestamp formats because they're dumb
-            try:
-                current_time = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-            except ValueError as e:
-                current_time = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S.%f')
+        yield bars, fill_values(means, empty, fill, previous)
 
-            if previous_time is None or is_same_interval(previous_time, current_time, interval):
-                interval_count += 1
-                interval_sum += price
-            else:
-                # Add previous
-                amount = 0.0 if interval_count == 0.0 else interval_sum / interval_count
-                data.append(create_point(previous_time, amount, interval, human_readable))
-                interval_count = 0
-                interval_sum = 0.0
+        if len(present):
+            previous = means[present[-1]]
+
+    if len(held):
+        yield held, fill_values(np.full(len(held), np.nan), np.ones(len(held), dtype=bool), fill, previous)
 
-                data.extend(generate_missing_points(current_time, increment_datetime(previous_time, interval), interval, human_readable))
+    if state is not None:
+        state['previous'] = previous
 
-            previous_time = current_time
 
-        if interval_count != 0:
-            amount = interval_sum / interval_count
-            data.append(create_point(previous_time, amount, interval, human_readable))
+def to_points(bars: np.ndarray, interval: Interval, human_readable: bool = False, start: int = None,
+              fill: str = 'zero') -> list:
+    """Turns bars into (time, mean price) points, one per interval from the first bar (or the interval after start)
+       to the last bar. Intervals without ticks are filled in with a policy (see fill_values).
 
-    return data, current_time
+    :param bars: An np array of BAR_DTYPE sorted by time.
+    :param interval: The interval of the bars.
+    :param human_readable: Whether the times should be strings instead of epoch seconds.
+    :param start: The start of an interval already covered, in wall-clock epoch seconds, or None.
+    :param fill: The fill policy (see FILL_POLICIES).
+    :return: A list of (time, mean price) tuples.
+    """
+    if len(bars) == 0:
+        return []
 
+    step = INTERVAL_SECONDS[interval]
+    first = bars['time'][0] if start is None else min(bars['time'][0], start + step)
 
-def aggregate_directory(directory_path: str, interval: Interval, human_readable: bool = False) -> list:
+    # Every interval is an index into the dense grid, so the gaps are just the indices no bar lands on
+    times = np.arange(first, bars['time'][-1] + step, step)
+    indices = (bars['time'] - first) // step
+
+    means = np.zeros(len(times))
+    means[indices] = bars['sum'] / bars['count']
+    empty = np.ones(len(times), dtype=bool)
+    empty[indices] = False
+
+    return list(zip(format_times(times, interval, human_readable).tolist(),
+                    fill_values(means, empty, fill).tolist()))
+
+
+def aggregate_file(file_path: str, start_date: datetime, interval: Interval, human_readable: bool = False,
+                   fill: str = 'zero') -> tuple:
+    """Aggregates a Bitfinex trade csv into the mean price of each interval. Intervals without ticks after the first
+       one (or after start_date) are filled in with a policy (see fill_values).
+
+    :param file_path: The path of the file.
+    :param start_date: The time of the last tick before this file, or None.
+    :param interval: The interval.
+    :param human_readable: Whether the times should be strings instead of epoch seconds.
+    :param fill: The fill policy (see FILL_POLICIES).
+    :return: A tuple of (list of (time, mean price) points, datetime of the start of the last interval or start_date if
+        there are no ticks).
+    """
+    bars = aggregate_ticks(file_path, interval)
+
+    if len(bars) == 0:
+        return [], start_date
+
+    start = None
+    if start_date is not None:
+        start = np.datetime64(start_date, 's').astype(np.int64)
+        start -= start % INTERVAL_SECONDS[interval]
+
+    data = to_points(bars, interval, human_readable, start, fill)
+
+    return data, datetime(1970, 1, 1) + timedelta(seconds=int(bars['time'][-1]))
+
+
+def input_files(directory_path: str) -> list:
+    """Lists the files of a directory in name order (which is tick order for the Bitfinex dumps).
+
+    :param directory_path: The directory.
+    :return: A list of file paths.
+    """
     if not os.path.exists(directory_path) or not os.path.isdir(directory_path):
         raise FileNotFoundError('Directory %s does not exist!' % directory_path)
 
-    data = []
+    file_paths = [os.path.join(directory_path, f) for f in sorted(os.listdir(directory_path))]
+
+    return [f for f in file_paths if os.path.isfile(f)]
+
+
+def aggregate_directory_bars(directory_path: str, interval: Interval, processes: int = None) -> np.ndarray:
+    """Aggregates every Bitfinex trade csv in a directory into bars, one file per worker process. Bars of an interval
+       that is split between files are combined exactly (from their sums and counts), so the result doesn't depend on
+       the number of processes.
+
+    :param directory_path: The directory of csv files.
+    :param interval: The interval of the bars.
+    :param processes: The number of worker processes. Defaults to None, meaning one per CPU. 1 means everything runs
+        in this process.
+    :return: An np array of BAR_DTYPE sorted by time.
+    """
+    file_paths = input_files(directory_path)
+    args = [(f, interval) for f in file_paths]
+
+    if processes == 1 or len(file_paths) < 2:
+        parts = [aggregate_ticks(*a) for a in args]
+    else:
+        with Pool(processes) as pool:
+            parts = pool.starmap(aggregate_ticks, args, chunksize=1)
+
+    # The files are merged in name order, so partial bars at their edges combine in tick order
+    return merge_bars(parts)
+
+
+def aggregate_directory(directory_path: str, interval: Interval, human_readable: bool = False,
+                        processes: int = None, fill: str = 'zero') -> list:
+    """Aggregates every Bitfinex trade csv in a directory into the mean price of each interval (see
+       aggregate_directory_bars and to_points).
+
+    :param directory_path: The directory of csv files.
+    :param interval: The interval.
+    :param human_readable: Whether the times should be strings instead of epoch seconds.
+    :param processes: The number of worker processes. Defaults to None, meaning one per CPU.
+    :param fill: The fill policy for intervals without ticks (see FILL_POLICIES).
+    :return: A list of (time, mean price) tuples.
+    """
+    return to_points(aggregate_directory_bars(directory_path, interval, processes), interval, human_readable,
+                     fill=fill)
+
+
+def stream_ticks(file_paths: list, chunk_size: int=CHUNK_SIZE, counter: list=None):
+    """Reads the ticks of several files in order, a chunk at a time (see read_ticks).
+
+    :param file_paths: The paths of the files, in tick order, or (path, start byte, end byte) tuples for parts of files.
+    :param chunk_size: The number of ticks per chunk.
+    :param counter: A list whose first element is increased by the number of ticks read. Defaults to None.
+    :return: A generator of tuples of np arrays (wall-clock epoch seconds, price, amount).
+    """
+    for file_path in file_paths:
+        file_path, start, end = file_path if isinstance(file_path, tuple) else (file_path, 0, None)
+
+        for ticks in read_ticks(file_path, chunk_size, start, end):
+            if counter is not None:
+                counter[0] += len(ticks[0])
+
+            yield ticks
+
+
+def stream_bars(tick_chunks, interval: Interval, pending: np.ndarray = None, state: dict = None):
+    """Buckets chunks of ticks into bars, holding back the last bar of each chunk until the next chunk shows whether it
+       continues there.
+
+    :param tick_chunks: An iterable of tuples of np arrays (wall-clock epoch seconds, price, amount), in tick order.
+    :param interval: The interval of the bars.
+    :param pending: A bar (an np array of BAR_DTYPE with one element) the ticks may continue. Defaults to None.
+    :param state: A dict to store the last bar in (under "pending") instead of yielding it. Defaults to None.
+    :return: A generator of np arrays of BAR_DTYPE, each sorted by time and after the previous one.
+    :raises OutOfOrderError: If a chunk starts before the bar held back from the previous one.
+    """
+    pending = np.zeros(0, dtype=BAR_DTYPE) if pending is None else pending
+
+    for times, prices, amounts in tick_chunks:
+        bars = bucket_ticks(times, prices, amounts, interval)
+
+        if len(bars) == 0:
+            continue
+
+        if len(pending) and bars['time'][0] < pending['time'][0]:
+            raise OutOfOrderError('Ticks must be in time order across chunks and files, got %s after %s instead' %
+                                  (bars['time'][0], pending['time'][0]))
+
+        bars = combine_bars(np.concatenate((pending, bars)))
+        pending = bars[-1:]
+
+        if len(bars) > 1:
+            yield bars[:-1]
+
+    if state is not None:
+        state['pending'] = pending if len(pending) else None
+    elif len(pending):
+        yield pending
+
+
+def fill_gaps(bar_blocks, interval: Interval, next_time: int = None, state: dict = None):
+    """Adds an empty bar (count 0, nan prices) for every interval without ticks between the first and the last bar.
+
+    :param bar_blocks: An iterable of np arrays of BAR_DTYPE, each sorted by time and after the previous one.
+    :param interval: The interval of the bars.
+    :param next_time: The interval the bars continue from, in wall-clock epoch seconds. Defaults to None, meaning the
+        first bar.
+    :param state: A dict to store the interval after the last bar in (under "next_time"). Defaults to None.
+    :return: A generator of np arrays of BAR_DTYPE with one bar per interval and at most GAP_BLOCK_SIZE bars each.
+    """
+    step = INTERVAL_SECONDS[interval]
+
+    for bars in bar_blocks:
+        if next_time is None:
+            next_time = bars['time'][0]
+
+        while len(bars):
+            # The dense bars from next_time up to the last bar of this block, GAP_BLOCK_SIZE at a time
+            end = min(bars['time'][-1] + step, next_time + GAP_BLOCK_SIZE * step)
+            present = bars[bars['time'] < end]
+
+            dense = np.zeros((end - next_time) // step, dtype=BAR_DTYPE)
+            dense['time'] = np.arange(next_time, end, step)
+            for field in ('open', 'high', 'low', 'close'):
+                dense[field] = np.nan
+            dense[(present['time'] - next_time) // step] = present
+
+            yield dense
+
+            bars = bars[len(present):]
+            next_time = end
+
+    if state is not None:
+        state['next_time'] = next_time
+
+
+def write_points(file, bar_blocks, interval: Interval, human_readable: bool = False, fill: str = 'zero',
+                 state: dict = None) -> int:
+    """Writes the (time, mean price) rows of create_file a block of bars at a time. Empty bars are filled in with a
+       policy (see fill_points).
+
+    :param file: A text file open for writing.
+    :param bar_blocks: An iterable of dense np arrays of BAR_DTYPE (see fill_gaps).
+    :param interval: The interval of the bars.
+    :param human_readable: Whether the times should be strings instead of epoch seconds.
+    :param fill: The fill policy (see FILL_POLICIES).
+    :param state: A dict to carry the last mean between calls (see fill_points). Defaults to None.
+    :return: The number of rows written.
+    """
+    rows = 0
+
+    for bars, means in fill_points(bar_blocks, fill, state):
+        pd.DataFrame({'time': format_times(bars['time'], interval, human_readable), 'mean': means},
+                     columns=['time', 'mean']).to_csv(file, header=False, index=False, na_rep='nan')
+        rows += len(bars)
+
+    return rows
+
+
+def write_bars(file, bar_blocks, interval: Interval, human_readable: bool = False, header: bool = True) -> int:
+    """Writes the rows of create_bar_file a block of bars at a time.
+
+    :param file: A text file open for writing.
+    :param bar_blocks: An iterable of np arrays of BAR_DTYPE.
+    :param interval: The interval of the bars.
+    :param human_readable: Whether the times should be strings instead of epoch seconds.
+    :param header: Whether to start with the header.
+    :return: The number of rows written.
+    """
+    rows = 0
+
+    for bars in bar_blocks:
+        with np.errstate(invalid='ignore'):
+            means = bars['sum'] / bars['count']
+
+        pd.DataFrame({'time': format_times(bars['time'], interval, human_readable), 'open': bars['open'],
+                      'high': bars['high'], 'low': bars['low'], 'close': bars['close'], 'mean': means,
+                      'count': bars['count'], 'volume': bars['volume']},
+                     columns=['time', 'open', 'high', 'low', 'close', 'mean', 'count', 'volume']).to_csv(
+            file, header=header and rows == 0, index=False)
+        rows += len(bars)
+
+    return rows
+
+
+def _npy_header(count: int) -> bytes:
+    """The NPY_HEADER_SIZE byte header of a version 1.0 .npy file of count BAR_DTYPE records."""
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(BAR_DTYPE),
+                                                                          count)
+    header = header.ljust(NPY_HEADER_SIZE - 11) + '\n'
+
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def write_npy(file, bar_blocks) -> int:
+    """Appends blocks of bars to a .npy file of BAR_DTYPE records, then rewrites its header with the new number of
+       records, so the file can be loaded (see read_bars) after every call.
 
-    time = None
+    :param file: A binary file open for writing, either empty or at the end of the records.
+    :param bar_blocks: An iterable of np arrays of BAR_DTYPE.
+    :return: The number of records written.
+    """
+    if file.tell() == 0:
+        file.write(_npy_header(0))
 
-    # Assumes interval (Minute, Hour, Day, etc.) is not split among files
-    for file_path in sorted(os.listdir(directory_path)):
-        print('Parsing data in file: %s' % file_path)
-        file_points, time = aggregate_file(os.path.join(directory_path, file_path), time, interval, human_readable)
-        data.extend(file_points)
+    rows = 0
 
-    # Validate unique intervals
-    # This is done to fix if the above assumption is invalid
-    print('Joining duplicate points...')
-    join_duplicates(data)
+    for bars in bar_blocks:
+        file.write(np.ascontiguousarray(bars, dtype=BAR_DTYPE).data)
+        rows += len(bars)
 
-    return data
+    end = file.tell()
+    file.seek(0)
+    file.write(_npy_header((end - NPY_HEADER_SIZE) // BAR_DTYPE.itemsize))
+    file.seek(end)
+
+    return rows
+
+
+def read_bars(file_path: str, mmap: bool = True) -> np.ndarray:
+    """Reads a .npy file of bars written by write_npy or create_npy_file. Times are wall-clock epoch seconds and empty
+       bars have a count of 0 and nan prices.
+
+    :param file_path: The path of the file.
+    :param mmap: Whether to map the file into memory (read only) instead of reading it.
+    :return: An np array of BAR_DTYPE.
+    """
+    if not os.path.exists(file_path) or not os.path.isfile(file_path):
+        raise FileNotFoundError('File %s does not exist!' % file_path)
+
+    bars = np.load(file_path, mmap_mode='r' if mmap else None)
+
+    if bars.dtype != BAR_DTYPE:
+        raise ValueError('%s must hold records of BAR_DTYPE, got %s instead' % (file_path, bars.dtype))
+
+    return bars
+
+
+def _is_npy(output_path: str) -> bool:
+    return output_path.lower().endswith('.npy')
+
+
+def _peak_rss() -> float:
+    """The peak resident set size of this process in MB, or nan where the resource module isn't available."""
+    if resource is None:
+        return np.nan
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes and macOS bytes
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def _sorted_bars(file_paths: list, interval: Interval, chunk_size: int = CHUNK_SIZE) -> np.ndarray:
+    """Aggregates files in memory the way aggregate_directory_bars does (each file on its own, then merged), for ticks
+       that are out of time order. Takes the same file paths or (path, start byte, end byte) tuples as stream_ticks.
+    """
+    parts = []
+
+    for file_path in file_paths:
+        file_path, start, end = file_path if isinstance(file_path, tuple) else (file_path, 0, None)
+        parts.append(merge_bars([bucket_ticks(times, prices, amounts, interval)
+                                 for times, prices, amounts in read_ticks(file_path, chunk_size, start, end)]))
+
+    return merge_bars(parts)
+
+
+def aggregate_stream(file_paths: list, output_path: str, interval: Interval, human_readable: bool = False,
+                     bars: bool = False, chunk_size: int = CHUNK_SIZE, fill: str = 'zero') -> StreamStats:
+    """Aggregates Bitfinex trade csvs (optionally .gz or .bz2) into a file, reading, bucketing, filling gaps and
+       writing a chunk at a time, so memory use doesn't grow with the input or the output.
+
+    :param file_paths: The paths of the files, in tick order (see input_files).
+    :param output_path: The path of the output file.
+    :param interval: The interval of the bars.
+    :param human_readable: Whether the times should be strings instead of epoch seconds.
+    :param bars: Whether to write full bars (see create_bar_file) instead of (time, mean price) points with the gaps
+        filled (see create_file).
+    :param chunk_size: The number of ticks per chunk.
+    :param fill: The fill policy for the mean price of intervals without ticks (see FILL_POLICIES).
+    :return: A StreamStats.
+
+    If the output path ends with .npy, the bars are written as binary BAR_DTYPE records instead (see write_npy), with
+    an empty bar (count 0, nan prices) for every gap unless bars is True.
+
+    Ticks out of time order across chunks or files can't be streamed, so on finding them the output is written again
+    from bars held in memory and sorted like aggregate_directory_bars does, which gives the same result.
+    """
+    start = clock.perf_counter()
+    counter = [0]
+    binary = _is_npy(output_path)
+
+    def write(file, blocks):
+        if binary:
+            return write_npy(file, blocks if bars else fill_gaps(blocks, interval))
+
+        if bars:
+            return write_bars(file, blocks, interval, human_readable)
+
+        return write_points(file, fill_gaps(blocks, interval), interval, human_readable, fill)
+
+    with open(output_path, 'wb' if binary else 'w', buffering=2 ** 20) as file:
+        try:
+            rows = write(file, stream_bars(stream_ticks(file_paths, chunk_size, counter), interval))
+        except OutOfOrderError:
+            # Late ticks can't join bars already written, so start over with every bar in memory
+            file.seek(0)
+            file.truncate()
+
+            sorted_bars = _sorted_bars(file_paths, interval, chunk_size)
+            counter[0] = int(sorted_bars['count'].sum())
+            rows = write(file, [sorted_bars] if len(sorted_bars) else [])
+
+    seconds = clock.perf_counter() - start
+
+    return StreamStats(counter[0], rows, seconds, counter[0] / seconds if seconds > 0 else np.nan, _peak_rss())
+
+
+def rebucket(bars: np.ndarray, interval: Interval) -> np.ndarray:
+    """Rolls bars up into a coarser interval (e.g. minute bars into hour bars). Sums, counts and volumes add up, highs
+       and lows are the extremes and opens and closes are those of the first and last bars, as in combine_bars.
+
+    :param bars: An np array of BAR_DTYPE sorted by time, of an interval that divides the new one.
+    :param interval: The new interval.
+    :return: An np array of BAR_DTYPE sorted by time.
+    """
+    bars = bars.copy()
+    bars['time'] -= bars['time'] % INTERVAL_SECONDS[interval]
+
+    return combine_bars(bars)
+
+
+def aggregate_rollup(file_paths: list, output_paths: dict, human_readable: bool = False, bars: bool = False,
+                     chunk_size: int = CHUNK_SIZE, fill: str = 'zero') -> StreamStats:
+    """Aggregates Bitfinex trade csvs into several intervals at once, like aggregate_stream for each of them but with a
+       single pass over the ticks. Only the finest interval is bucketed from the ticks; each coarser one is rolled up
+       from its bars (see rebucket), so every extra interval costs about as much as writing its output. Ticks out of
+       time order are handled as in aggregate_stream, reading them once per interval.
+
+    :param file_paths: The paths of the files, in tick order (see input_files).
+    :param output_paths: A dict of Interval to the path of its output file.
+    :param human_readable: Whether the times should be strings instead of epoch seconds.
+    :param bars: Whether to write full bars instead of (time, mean price) points (see aggregate_stream).
+    :param chunk_size: The number of ticks per chunk.
+    :param fill: The fill policy for the mean price of intervals without ticks (see FILL_POLICIES).
+    :return: A StreamStats, counting the rows of every output as bars.
+    """
+    start = clock.perf_counter()
+    counter = [0]
+
+    intervals = sorted(output_paths, key=lambda interval: INTERVAL_SECONDS[interval])
+    files, pending, gaps = {}, {}, {}
+    rows = 0
+
+    def write(interval, closed):
+        file = files[interval]
+        blocks = [closed] if bars else fill_gaps([closed], interval, gaps[interval].get('next_time'), gaps[interval])
+
+        if _is_npy(output_paths[interval]):
+            return write_npy(file, blocks)
+
+        if bars:
+            return write_bars(file, blocks, interval, human_readable, header=file.tell() == 0)
+
+        return write_points(file, blocks, interval, human_readable, fill, gaps[interval])
+
+    try:
+        for interval in intervals:
+            files[interval] = open(output_paths[interval], 'wb' if _is_npy(output_paths[interval]) else 'w',
+                                   buffering=2 ** 20)
+            pending[interval], gaps[interval] = np.zeros(0, dtype=BAR_DTYPE), {}
+
+        try:
+            for block in stream_bars(stream_ticks(file_paths, chunk_size, counter), intervals[0]):
+                rows += write(intervals[0], block)
+
+                for interval in intervals[1:]:
+                    # The last coarser bar stays open until a finer bar after it shows up
+                    rolled = rebucket(np.concatenate((pending[interval], block)), interval)
+                    pending[interval] = rolled[-1:]
+
+                    if len(rolled) > 1:
+                        rows += write(interval, rolled[:-1])
+        except OutOfOrderError:
+            # Start over from bars held in memory, as in aggregate_stream. Each interval is bucketed from the ticks
+            # again, since with overlapping files rolling up would take opens and closes in time order rather than in
+            # tick order.
+            rows = 0
+
+            for interval in intervals:
+                files[interval].seek(0)
+                files[interval].truncate()
+                gaps[interval].clear()
+
+                interval_bars = _sorted_bars(file_paths, interval, chunk_size)
+                counter[0] = int(interval_bars['count'].sum())
+                pending[interval] = np.zeros(0, dtype=BAR_DTYPE)
+
+                if len(interval_bars):
+                    rows += write(interval, interval_bars)
+
+        for interval in intervals[1:]:
+            if len(pending[interval]):
+                rows += write(interval, pending[interval])
+    finally:
+        for file in files.values():
+            file.close()
+
+    seconds = clock.perf_counter() - start
+
+    return StreamStats(counter[0], rows, seconds, counter[0] / seconds if seconds > 0 else np.nan, _peak_rss())
+
+
+def _line_end(file_path: str) -> int:
+    """The byte offset just after the last complete line of a file (a file being appended to may end mid line)."""
+    size = os.path.getsize(file_path)
+
+    with open(file_path, 'rb') as file:
+        file.seek(max(size - MANIFEST_HASH_BYTES, 0))
+        tail = file.read()
+
+    newline = tail.rfind(b'\n')
+
+    return size if newline < 0 else size - len(tail) + newline + 1
+
+
+def _tail_hash(file_path: str, offset: int) -> str:
+    """The sha1 of the MANIFEST_HASH_BYTES bytes before offset, to check that a file was only appended to."""
+    with open(file_path, 'rb') as file:
+        file.seek(max(offset - MANIFEST_HASH_BYTES, 0))
+        return hashlib.sha1(file.read(min(offset, MANIFEST_HASH_BYTES))).hexdigest()
+
+
+def _is_compressed(file_path: str) -> bool:
+    return file_path.endswith('.gz') or file_path.endswith('.bz2')
+
+
+def _plan(manifest: dict, file_paths: list) -> list:
+    """Works out which byte ranges of which files haven't been aggregated yet.
+
+    :return: A list of (file path, start, end) tuples, or None if the files changed in a way that needs everything to
+        be aggregated again (a file shrank or was rewritten, a compressed file changed or a new file sorts before one
+        already aggregated).
+    """
+    ranges = []
+
+    for file_path in file_paths:
+        entry = manifest['files'].get(os.path.basename(file_path))
+
+        if entry is None:
+            end = os.path.getsize(file_path) if _is_compressed(file_path) else _line_end(file_path)
+            ranges.append((file_path, 0, end))
+            continue
+
+        # New ticks can only be appended to the output if they come after every tick already aggregated
+        if len(ranges) or os.path.getsize(file_path) < entry['offset'] or \
+                _tail_hash(file_path, entry['offset']) != entry['sha1']:
+            return None
+
+        if _is_compressed(file_path):
+            if os.path.getsize(file_path) != entry['offset']:
+                return None
+            continue
+
+        end = _line_end(file_path)
+        if end > entry['offset']:
+            ranges.append((file_path, entry['offset'], end))
+
+    return ranges
+
+
+def aggregate_incremental(directory_path: str, output_path: str, interval: Interval, human_readable: bool = False,
+                          bars: bool = False, chunk_size: int = CHUNK_SIZE, fill: str = 'zero') -> StreamStats:
+    """Aggregates a directory of Bitfinex trade csvs into a file like aggregate_stream, but only reads what was added
+       since the last run: new files and lines appended to files already read.
+
+    A manifest next to the output (<output>.manifest.json) keeps each file's aggregated size and a hash of its last
+    bytes, the output size up to the last closed interval, and the last bar, which may still be open. Later runs cut
+    the output back to the last closed interval, continue the last bar with the new ticks and append. If the files or
+    the settings changed in any other way, or the new ticks go back before the last bar, everything is aggregated
+    again.
+
+    :param directory_path: The directory of csv files.
+    :param output_path: The path of the output file.
+    :param interval: The interval of the bars.
+    :param human_readable: Whether the times should be strings instead of epoch seconds.
+    :param bars: Whether to write full bars instead of (time, mean price) points (see aggregate_stream).
+    :param chunk_size: The number of ticks per chunk.
+    :param fill: The fill policy for the mean price of intervals without ticks (see FILL_POLICIES).
+    :return: A StreamStats for the ticks read and rows written in this run.
+    """
+    start = clock.perf_counter()
+    manifest_path = '%s.manifest.json' % output_path
+    settings = {'interval': interval.name, 'human_readable': human_readable, 'bars': bars, 'fill': fill}
+    file_paths = input_files(directory_path)
+
+    try:
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = None
+
+    ranges = None
+    if manifest is not None and manifest['settings'] == settings and os.path.exists(output_path) and \
+            os.path.getsize(output_path) >= manifest['closed_size']:
+        ranges = _plan(manifest, file_paths)
+
+    if ranges is None:
+        manifest = {'settings': settings, 'files': {}, 'closed_size': 0, 'next_time': None, 'previous': None,
+                    'pending': None}
+        ranges = _plan(manifest, file_paths)
+    elif len(ranges) == 0:
+        return StreamStats(0, 0, clock.perf_counter() - start, np.nan, _peak_rss())
+
+    pending = None
+    if manifest['pending'] is not None:
+        pending = np.array([tuple(manifest['pending'])], dtype=BAR_DTYPE)
+
+    counter = [0]
+    ticks = stream_ticks(ranges, chunk_size, counter)
+    # The last mean of the closed part, which the policy may fill the empty intervals after it with
+    state = {'previous': np.nan if manifest.get('previous') is None else manifest['previous']}
+
+    binary = _is_npy(output_path)
+
+    def write(file, closed):
+        """Writes the closed bars, then the last bar (state["pending"]) after them.
+
+        :return: A tuple of (rows written, interval after the closed part, size of the closed part).
+        """
+        if binary:
+            if bars:
+                rows = write_npy(file, closed)
+                next_time = None
+            else:
+                rows = write_npy(file, fill_gaps(closed, interval, manifest['next_time'], state))
+                next_time = state.get('next_time', manifest['next_time'])
+        elif bars:
+            rows = write_bars(file, closed, interval, human_readable, header=manifest['closed_size'] == 0)
+            next_time = None
+        else:
+            rows = write_points(file, fill_gaps(closed, interval, manifest['next_time'], state), interval,
+                                human_readable, fill, state)
+            next_time = state.get('next_time', manifest['next_time'])
+
+        file.flush()
+        closed_size = file.tell()
+
+        # The last bar (and the empty intervals before it) go after the closed part, so the next run can replace them
+        last = state['pending']
+        if last is not None:
+            if binary:
+                rows += write_npy(file, [last] if bars else fill_gaps([last], interval, next_time))
+            elif bars:
+                rows += write_bars(file, [last], interval, human_readable, header=closed_size == 0)
+            else:
+                rows += write_points(file, fill_gaps([last], interval, next_time), interval, human_readable, fill,
+                                     dict(state))
+
+        return rows, next_time, closed_size
+
+    mode = ('r+' if manifest['closed_size'] > 0 else 'w') + ('b' if binary else '')
+    with open(output_path, mode, buffering=2 ** 20) as file:
+        file.truncate(manifest['closed_size'])
+        file.seek(manifest['closed_size'])
+
+        try:
+            rows, next_time, closed_size = write(file, stream_bars(ticks, interval, pending, state))
+        except OutOfOrderError:
+            # Late ticks can't join bars already closed, so every file is aggregated again with the bars held in
+            # memory, as aggregate_stream does
+            manifest = {'settings': settings, 'files': {}, 'closed_size': 0, 'next_time': None, 'previous': None,
+                        'pending': None}
+            ranges = _plan(manifest, file_paths)
+
+            file.seek(0)
+            file.truncate()
+
+            sorted_bars = _sorted_bars(ranges, interval, chunk_size)
+            counter[0] = int(sorted_bars['count'].sum())
+            state = {'previous': np.nan, 'pending': sorted_bars[-1:] if len(sorted_bars) else None}
+
+            rows, next_time, closed_size = write(file, [sorted_bars[:-1]] if len(sorted_bars) > 1 else [])
+
+    pending = state['pending']
+
+    for file_path, _, last in ranges:
+        manifest['files'][os.path.basename(file_path)] = {'offset': last, 'sha1': _tail_hash(file_path, last)}
+
+    manifest['closed_size'] = closed_size
+    manifest['next_time'] = None if next_time is None else int(next_time)
+    manifest['previous'] = None if np.isnan(state['previous']) else float(state['previous'])
+    manifest['pending'] = None if pending is None else [v.item() for v in pending[0]]
+
+    temporary = '%s.tmp' % manifest_path
+    with open(temporary, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(temporary, manifest_path)
+
+    seconds = clock.perf_counter() - start
+
+    return StreamStats(counter[0], rows, seconds, counter[0] / seconds if seconds > 0 else np.nan, _peak_rss())
 
 
 def create_file(output_path: str, data: list):
@@ -164,24 +997,103 @@ def create_file(output_path: str, data: list):
         for row in data:
             file.write('%s,%s\n' % (row[0], row[1]))
 
+
+def create_bar_file(output_path: str, bars: np.ndarray, interval: Interval, human_readable: bool = False):
+    """Writes bars to a csv with the header time,open,high,low,close,mean,count,volume.
+
+    :param output_path: The path of the file.
+    :param bars: An np array of BAR_DTYPE.
+    :param interval: The interval of the bars.
+    :param human_readable: Whether the times should be strings instead of epoch seconds.
+    """
+    df = pd.DataFrame({'time': format_times(bars['time'], interval, human_readable), 'open': bars['open'],
+                       'high': bars['high'], 'low': bars['low'], 'close': bars['close'],
+                       'mean': bars['sum'] / bars['count'], 'count': bars['count'], 'volume': bars['volume']},
+                      columns=['time', 'open', 'high', 'low', 'close', 'mean', 'count', 'volume'])
+
+    df.to_csv(output_path, index=False)
+
+
+def create_npy_file(output_path: str, bars: np.ndarray):
+    """Writes bars to a .npy file of BAR_DTYPE records (see read_bars).
+
+    :param output_path: The path of the file.
+    :param bars: An np array of BAR_DTYPE.
+    """
+    with open(output_path, 'wb', buffering=2 ** 20) as file:
+        write_npy(file, [bars])
+
+
 if __name__ == '__main__':
-    input_directory, output_file, interval, human_readable = sys.argv[1:]
-    if interval.lower() == 'day':
-        interval = Interval.Day
-    elif interval.lower() == 'hour':
-        interval = interval.Hour
-    elif interval.lower() == 'minute':
-        interval = interval.Minute
-    else:
-        raise ValueError('Invalid interval %s given!' % interval)
+    # Usage: csv_aggregate.py <input directory> <output file> <day|hour|minute[,...]> <human readable> [bars]
+    #        [parallel|incremental] [fill=zero|ffill|nan|interpolate]
+    # Output files ending with .npy get binary BAR_DTYPE records (see read_bars) and ignore human readable.
+    # With several intervals (e.g. minute,hour,day) they are all built in one pass and the interval name is added to
+    # the output file name of each (e.g. out.csv becomes out_minute.csv, out_hour.csv and out_day.csv).
+    input_directory, output_file, interval_names, human_readable = sys.argv[1:5]
+    options = [option.lower() for option in sys.argv[5:]]
+    fill = ([option[len('fill='):] for option in options if option.startswith('fill=')] or ['zero'])[-1]
+    options = [option for option in options if not option.startswith('fill=')]
+
+    intervals = []
+    for interval in interval_names.split(','):
+        if interval.lower() == 'day':
+            intervals.append(Interval.Day)
+        elif interval.lower() == 'hour':
+            intervals.append(Interval.Hour)
+        elif interval.lower() == 'minute':
+            intervals.append(Interval.Minute)
+        else:
+            raise ValueError('Invalid interval %s given!' % interval)
 
-    human_readable = bool(human_readable)
+    interval = intervals[0]
+    human_readable = human_readable.lower() in ('1', 'true', 'yes')
 
     print('Parsing data in directory: %s' % input_directory)
-    data = aggregate_directory(input_directory, interval, human_readable)
+    start = clock.perf_counter()
+
+    if len(intervals) > 1:
+        if 'parallel' in options or 'incremental' in options:
+            raise ValueError('Several intervals can only be built by the streaming mode, got %s instead' %
+                             ' '.join(options))
+
+        root, extension = os.path.splitext(output_file)
+        output_paths = {i: '%s_%s%s' % (root, i.name.lower(), extension) for i in intervals}
+
+        stats = aggregate_rollup(input_files(input_directory), output_paths, human_readable, 'bars' in options,
+                                 fill=fill)
 
-    print('Creating output file: %s' % output_file)
-    create_file(output_file, data)
+        print('Wrote %s rows to %s from %s ticks in %.2fs (%.0f ticks/s, peak RSS %.0fMB)' %
+              (stats.bars, ', '.join(output_paths[i] for i in intervals), stats.ticks, stats.seconds,
+               stats.ticks_per_second, stats.peak_rss))
+    elif 'parallel' in options:
+        # Every file in its own process, with everything held in memory
+        if 'bars' in options or _is_npy(output_file):
+            data = aggregate_directory_bars(input_directory, interval)
 
-    print('Done')
+            if 'bars' not in options and len(data):
+                data = np.concatenate(list(fill_gaps([data], interval)))
+
+            print('Creating output file: %s' % output_file)
+            if _is_npy(output_file):
+                create_npy_file(output_file, data)
+            else:
+                create_bar_file(output_file, data, interval, human_readable)
+        else:
+            data = aggregate_directory(input_directory, interval, human_readable, fill=fill)
+
+            print('Creating output file: %s' % output_file)
+            create_file(output_file, data)
+
+        print('Done in %.2fs' % (clock.perf_counter() - start))
+    else:
+        if 'incremental' in options:
+            # Only the files and lines added since the last run are read
+            stats = aggregate_incremental(input_directory, output_file, interval, human_readable, 'bars' in options,
+                                          fill=fill)
+        else:
+            stats = aggregate_stream(input_files(input_directory), output_file, interval, human_readable,
+                                     'bars' in options, fill=fill)
 
+        print('Wrote %s rows from %s ticks in %.2fs (%.0f ticks/s, peak RSS %.0fMB)' %
+              (stats.bars, stats.ticks, stats.seconds, stats.ticks_per_second, stats.peak_rss))
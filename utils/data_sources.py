@@ -0,0 +1,214 @@
+import json
+import os
+
+import numpy as np
+import matplotlib.dates as mdates
+import pandas as pd
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def _date(date) -> pd.Timestamp:
+    """Converts a date (string, datetime, or None for today) to a day timestamp."""
+    return pd.Timestamp(date if date is not None else 'today').normalize()
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """Gives a frame of prices a sorted daily DatetimeIndex named date and float price columns."""
+    df = df.copy()
+    df.index = pd.to_datetime(df.index).normalize()
+    df.index.name = 'date'
+    df.columns = [str(c).lower() for c in df.columns]
+
+    return df[PRICE_COLUMNS].astype(float).sort_index()
+
+
+class DataSource:
+    """A source of daily open, high, low, close and volume prices."""
+
+    def fetch(self, symbols: list, start_date, end_date=None) -> dict:
+        """Gets the prices of several symbols.
+
+        :param symbols: The symbols.
+        :param start_date: The first date (inclusive).
+        :param end_date: The last date (inclusive). Defaults to None, meaning today.
+        :return: A dict of symbol to data frame with the columns open, high, low, close and volume, indexed by date.
+            Symbols without any data are left out.
+        """
+        raise NotImplementedError()
+
+
+class RemoteSource(DataSource):
+    """Prices from pandas_datareader, with all the symbols requested in one call."""
+
+    def __init__(self, provider: str='iex'):
+        self.provider = provider
+
+    def fetch(self, symbols: list, start_date, end_date=None) -> dict:
+        import pandas_datareader.data as web
+
+        if len(symbols) == 0:
+            return {}
+
+        data = web.DataReader(list(symbols) if len(symbols) > 1 else symbols[0], self.provider, _date(start_date),
+                              _date(end_date))
+
+        if isinstance(data, dict):
+            frames = data
+        elif len(symbols) == 1:
+            frames = {symbols[0]: data}
+        else:
+            # Columns are (field, symbol)
+            frames = {symbol: data.xs(symbol, axis=1, level=1) for symbol in symbols}
+
+        return {symbol: _normalize(df) for symbol, df in frames.items() if len(df)}
+
+
+class LocalFileSource(DataSource):
+    """Prices from a directory of <symbol>.csv files with the columns date, open, high, low, close and volume. It can
+       stand in for RemoteSource with no network.
+    """
+
+    def __init__(self, directory_path: str):
+        self.directory_path = directory_path
+
+    def path(self, symbol: str) -> str:
+        return os.path.join(self.directory_path, '%s.csv' % symbol)
+
+    def read(self, symbol: str):
+        """Reads every price of a symbol.
+
+        :param symbol: The symbol.
+        :return: A data frame of prices, or None if there is no file for the symbol.
+        """
+        if not os.path.exists(self.path(symbol)):
+            return None
+
+        return _normalize(pd.read_csv(self.path(symbol), index_col='date'))
+
+    def fetch(self, symbols: list, start_date, end_date=None) -> dict:
+        frames = {}
+
+        for symbol in symbols:
+            df = self.read(symbol)
+
+            if df is not None:
+                df = df.loc[_date(start_date):_date(end_date)]
+
+                if len(df):
+                    frames[symbol] = df
+
+        return frames
+
+
+class CachedSource(DataSource):
+    """Keeps the prices fetched from another source in a directory (one csv per symbol, see LocalFileSource) and only
+       asks that source for the dates before or after the range already covered. Symbols missing the same range are
+       fetched together. A range only counts as covered up to the last date the source returned for it, and today
+       never does, so empty or partial responses and today's prices are asked for again.
+    """
+
+    def __init__(self, source: DataSource, directory_path: str):
+        self.source = source
+        self.local = LocalFileSource(directory_path)
+        self.coverage_path = os.path.join(directory_path, 'coverage.json')
+
+        os.makedirs(directory_path, exist_ok=True)
+
+    def _coverage(self) -> dict:
+        try:
+            with open(self.coverage_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_coverage(self, coverage: dict):
+        temporary = '%s.tmp' % self.coverage_path
+        with open(temporary, 'w') as file:
+            json.dump(coverage, file, indent=2, sort_keys=True)
+        os.replace(temporary, self.coverage_path)
+
+    def missing_ranges(self, symbol: str, start_date, end_date=None) -> list:
+        """Works out which dates of a request aren't cached. A request that doesn't reach the cached range is extended
+           up to it, so the range covered stays contiguous.
+
+        :return: A list of (start, end) timestamp tuples.
+        """
+        start, end = _date(start_date), _date(end_date)
+        covered = self._coverage().get(symbol)
+
+        if covered is None:
+            return [(start, end)]
+
+        covered_start, covered_end = pd.Timestamp(covered[0]), pd.Timestamp(covered[1])
+        ranges = []
+
+        if start < covered_start:
+            ranges.append((start, covered_start - pd.Timedelta(days=1)))
+
+        if end > covered_end:
+            ranges.append((covered_end + pd.Timedelta(days=1), end))
+
+        return ranges
+
+    def fetch(self, symbols: list, start_date, end_date=None) -> dict:
+        start, end = _date(start_date), _date(end_date)
+
+        requests = {}
+        for symbol in symbols:
+            for missing in self.missing_ranges(symbol, start, end):
+                requests.setdefault(missing, []).append(symbol)
+
+        if requests:
+            coverage = self._coverage()
+            cached = {symbol: self.local.read(symbol) for symbol in symbols}
+
+            for (missing_start, missing_end), missing_symbols in sorted(requests.items()):
+                fetched = self.source.fetch(missing_symbols, missing_start, missing_end)
+
+                for symbol in missing_symbols:
+                    if symbol not in fetched or len(fetched[symbol]) == 0:
+                        continue
+
+                    df = fetched[symbol] if cached[symbol] is None else pd.concat([cached[symbol], fetched[symbol]])
+                    cached[symbol] = df[~df.index.duplicated(keep='last')].sort_index()
+
+                    # Only the dates up to the last one returned count as covered, and never today, whose prices can
+                    # still change
+                    answered_end = min(fetched[symbol].index.max(), missing_end, _date(None) - pd.Timedelta(days=1))
+                    if answered_end < missing_start:
+                        continue
+
+                    if symbol not in coverage:
+                        coverage[symbol] = [missing_start.isoformat(), answered_end.isoformat()]
+                        continue
+
+                    covered_start, covered_end = pd.Timestamp(coverage[symbol][0]), pd.Timestamp(coverage[symbol][1])
+
+                    # A response that stops short of the cached range would leave a hole, so it isn't recorded
+                    if missing_start <= covered_end + pd.Timedelta(days=1) and \
+                            answered_end >= covered_start - pd.Timedelta(days=1):
+                        coverage[symbol] = [min(covered_start, missing_start).isoformat(),
+                                            max(covered_end, answered_end).isoformat()]
+
+            for symbol in set(s for request in requests.values() for s in request):
+                if cached[symbol] is not None:
+                    cached[symbol].to_csv(self.local.path(symbol))
+
+            self._save_coverage(coverage)
+
+        return self.local.fetch(symbols, start, end)
+
+
+def default_source() -> DataSource:
+    """The source used by read_stock by default: "iex" cached under ~/.cache/fugger-junior/stocks."""
+    return CachedSource(RemoteSource('iex'), os.path.join(os.path.expanduser('~'), '.cache', 'fugger-junior', 'stocks'))
+
+
+def to_columns(df: pd.DataFrame) -> tuple:
+    """Converts a data frame of prices to the tuple returned by read_file in movingaverages.py.
+
+    :param df: The data frame of prices.
+    :return: A tuple of np arrays (date, open_price, high_price, low_price, close_price, volume).
+    """
+    return (mdates.date2num(df.index.values),) + tuple(np.asarray(df[c].values, dtype=float) for c in PRICE_COLUMNS)
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from correlation import align_series, read_currency_file
+
+COINMARKETCAP_COLUMNS = {'date': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5}
+
+# values has shape (features, assets, dates); names labels the features and assets the assets
+FeatureMatrix = namedtuple('FeatureMatrix', ['values', 'names', 'assets', 'dates'])
+
+
+def feature_names(volatility_windows: tuple=(20,), lags: tuple=(1, 2, 3)) -> list:
+    """The names of the features build_features computes, in order.
+
+    :param volatility_windows: The windows of the rolling volatilities.
+    :param lags: The lags of the lagged returns.
+    :return: A list of names.
+    """
+    return (['return', 'log_return', 'diff'] + ['volatility_%s' % w for w in volatility_windows] +
+            ['return_lag_%s' % lag for lag in lags])
+
+
+def build_features(prices: np.ndarray, assets: list=None, dates: np.ndarray=None, volatility_windows: tuple=(20,),
+                   lags: tuple=(1, 2, 3), out: np.ndarray=None) -> FeatureMatrix:
+    """Computes the features of a block of aligned prices (e.g. from correlation.align_series) in one pass, straight
+       into a float32 buffer:
+        return: the percent change from the previous price (nan where the previous price is 0);
+        log_return: the log of 1 + return;
+        diff: the change from the previous price;
+        volatility_<w>: the standard deviation of the last w returns (skipping nans);
+        return_lag_<k>: the return k dates earlier.
+    Values that can't be computed (the first dates, or next to missing prices) are nan.
+
+    :param prices: A 2-D np array with one row of prices per asset, or a 1-D np array for a single asset.
+    :param assets: The names of the assets. Defaults to None, meaning their row numbers.
+    :param dates: The dates of the prices. Defaults to None.
+    :param volatility_windows: The windows of the rolling volatilities.
+    :param lags: The lags of the lagged returns.
+    :param out: A float32 buffer of shape (features, assets, dates) to write to, e.g. one reused between calls or a
+        memory-mapped file. Defaults to None, meaning a new one.
+    :return: A FeatureMatrix.
+    """
+    prices = np.atleast_2d(np.asarray(prices, dtype=float))
+    rows, n = prices.shape
+    names = feature_names(volatility_windows, lags)
+
+    if out is None:
+        out = np.empty((len(names), rows, n), dtype=np.float32)
+    elif out.shape != (len(names), rows, n) or out.dtype != np.float32:
+        raise ValueError('out must be a float32 array of shape %s, got %s %s instead' %
+                         ((len(names), rows, n), out.dtype, out.shape))
+
+    returns, log_returns, diffs = out[0], out[1], out[2]
+    previous, current = prices[:, :-1], prices[:, 1:]
+
+    out[:, :, :1] = np.nan
+    np.subtract(current, previous, out=diffs[:, 1:])
+
+    returns[:, 1:] = np.nan
+    np.divide(diffs[:, 1:], previous, out=returns[:, 1:], where=previous != 0)
+    np.log1p(returns, out=log_returns)
+
+    # Running sums of the returns, their squares and how many of them aren't nan, shared by every window
+    valid = ~np.isnan(returns)
+    totals = np.zeros((3, rows, n + 1))
+    np.cumsum(np.where(valid, returns, 0.), axis=1, out=totals[0, :, 1:])
+    np.cumsum(np.where(valid, np.square(returns, dtype=float), 0.), axis=1, out=totals[1, :, 1:])
+    np.cumsum(valid, axis=1, out=totals[2, :, 1:])
+
+    for i, window in enumerate(volatility_windows):
+        volatility = out[3 + i]
+        volatility[:, :window] = np.nan
+
+        if window >= n:
+            volatility[:] = np.nan
+            continue
+
+        sums = totals[:, :, window + 1:] - totals[:, :, 1:-window]
+        count = sums[2]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = (sums[1] - sums[0] * sums[0] / count) / (count - 1)
+
+        np.sqrt(np.maximum(variance, 0.), out=volatility[:, window:], where=count > 1)
+        volatility[:, window:][count <= 1] = np.nan
+
+    for i, lag in enumerate(lags, 3 + len(volatility_windows)):
+        out[i, :, :lag] = np.nan
+        out[i, :, lag:] = returns[:, :n - lag]
+
+    assets = list(assets) if assets is not None else list(range(rows))
+
+    return FeatureMatrix(out, names, assets, dates)
+
+
+def select(features: FeatureMatrix, name: str, asset=None) -> np.ndarray:
+    """Gets a view of one feature.
+
+    :param features: The FeatureMatrix.
+    :param name: The name of the feature.
+    :param asset: The name of an asset. Defaults to None, meaning every asset.
+    :return: An np array view with one row per asset, or a single row if an asset is given.
+    """
+    values = features.values[features.names.index(name)]
+
+    return values if asset is None else values[features.assets.index(asset)]
+
+
+def as_samples(features: FeatureMatrix) -> np.ndarray:
+    """Gets a (dates, features * assets) view of the matrix, one row per date, for model training.
+
+    :param features: The FeatureMatrix.
+    :return: An np array view. Column f * assets + a is feature f of asset a.
+    """
+    values = features.values
+
+    return values.reshape(-1, values.shape[2]).T
+
+
+def load_prices(directory_path: str='../data/coinmarketcap') -> tuple:
+    """Loads the closing prices of every coin in a directory of coinmarketcap csv files on the union of their dates.
+
+    :param directory_path: The directory of csv files.
+    :return: A tuple of (list of coin names, np array of dates, 2-D np array with one row of prices per coin).
+    """
+    if not os.path.exists(directory_path) or not os.path.isdir(directory_path):
+        raise FileNotFoundError('Directory %s does not exist!' % directory_path)
+
+    assets, series = [], []
+    for name in sorted(os.listdir(directory_path)):
+        if name.endswith('.csv'):
+            date, _, _, _, close_price, _ = read_currency_file(os.path.join(directory_path, name),
+                                                                COINMARKETCAP_COLUMNS)
+            assets.append(os.path.splitext(name)[0])
+            series.append((date, close_price))
+
+    dates, prices = align_series(series, how='outer')
+
+    return assets, dates, prices
+
+
+if __name__ == '__main__':
+    assets, dates, prices = load_prices(sys.argv[1] if len(sys.argv) > 1 else '../data/coinmarketcap')
+
+    start = time.perf_counter()
+    features = build_features(prices, assets, dates)
+    print('Built %s features for %s assets over %s dates (%.1fMB) in %.3fs' %
+          (len(features.names), len(assets), len(dates), features.values.nbytes / 2 ** 20, time.perf_counter() - start))
+
+    for name in features.names:
+        print('%15s  bitcoin: %s' % (name, select(features, name, 'bitcoin')[-5:]))
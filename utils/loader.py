@@ -0,0 +1,67 @@
+import numpy as np
+import matplotlib.dates as mdates
+import pandas as pd
+
+
+def read_columns(file_path: str, column_map: dict, names: tuple, delimiter: str=';', dt_format: str='%d/%m/%Y',
+                 header: bool=True, reverse: bool=True, num_rows: int=-1, dtypes: dict=None) -> tuple:
+    """Reads a date column and some numeric columns of a csv file straight into typed np arrays.
+
+    The dates are parsed in bulk (as datetime64) and converted to matplotlib date numbers. Reversing returns reversed
+    views of the columns, and when reversing only the first num_rows rows of the file are parsed.
+
+    :param file_path: The path of the file.
+    :param column_map: A dict mapping of each header to a column index. Should include date and every name in names.
+    :param names: The names of the numeric columns to return, in order.
+    :param delimiter: The csv delimiter.
+    :param dt_format: The format of the date column.
+    :param header: Whether the csv starts with a header.
+    :param reverse: Whether the data should be reversed (useful if data is sorted by data desc and should be asc).
+    :param num_rows: The number of rows that should be kept.
+    :param dtypes: The dtype of any numeric column that shouldn't be float.
+    :return: A tuple of np arrays (date, *names).
+    """
+    dtypes = dtypes or {}
+    date_index = column_map['date']
+
+    columns = {date_index: str}
+    for name in names:
+        columns[column_map[name]] = dtypes.get(name, np.float64)
+
+    # Counting from the end of a reversed file is counting from the start of the file
+    nrows = num_rows if reverse and num_rows > 0 else None
+
+    # round_trip parses floats exactly the way float() does
+    df = pd.read_csv(file_path, sep=delimiter, header=None, skiprows=1 if header else 0, usecols=sorted(columns),
+                     dtype=columns, nrows=nrows, float_precision='round_trip')
+
+    # Each distinct date string is only parsed once
+    codes, unique_dates = pd.factorize(df[date_index].values)
+    unique_dates = pd.to_datetime(pd.Series(unique_dates, dtype=object).str.replace('v', '/'), format=dt_format)
+
+    data = [mdates.date2num(unique_dates.values)[codes]] + [df[column_map[name]].values for name in names]
+
+    if reverse:
+        data = [column[::-1] for column in data]
+    elif num_rows > 0:
+        data = [column[-num_rows:] for column in data]
+
+    return tuple(data)
+
+
+def read_price_file(file_path: str, column_map: dict, delimiter: str=';', dt_format: str='%d/%m/%Y',
+                    header: bool=True, reverse: bool=True, num_rows: int=-1) -> tuple:
+    """Reads a csv file of prices and returns the formatted data columns.
+
+    :param file_path: The path of the file.
+    :param column_map: A dict mapping of each header to a column index. Should include all of the following:
+        date, open, high, low, close, and volume.
+    :param delimiter: The csv delimiter.
+    :param dt_format: The format of the date column.
+    :param header: Whether the csv starts with a header.
+    :param reverse: Whether the data should be reversed (useful if data is sorted by data desc and should be asc).
+    :param num_rows: The number of rows that should be kept.
+    :return: A tuple of np arrays (date, open_price, high_price, low_price, close_price, volume).
+    """
+    return read_columns(file_path, column_map, ('open', 'high', 'low', 'close', 'volume'), delimiter, dt_format,
+                        header, reverse, num_rows)
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import matplotlib.dates as mdates
+import pandas as pd
+
+from csv_aggregate import read_bars
+from loader import read_columns, read_price_file
+
+COINMARKETCAP_COLUMNS = {'date': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5}
+
+
+def detect_kind(file_path: str) -> str:
+    """Works out what kind of csv a file is from its first line.
+
+    :param file_path: The path of the file.
+    :return: "coinmarketcap" (Date;Open;High;Low;Close;Volume;...), "subscriber" (date,growth), "bars"
+        (csv_aggregate.create_bar_file), "aggregate" (the headerless output of csv_aggregate.create_file) or "npy"
+        (the binary bars of csv_aggregate.create_npy_file, detected from the .npy extension).
+    """
+    if file_path.lower().endswith('.npy'):
+        return 'npy'
+
+    with open(file_path, 'r') as file:
+        first_line = file.readline().strip().lower()
+
+    if first_line.startswith('date;open;high;low;close;volume'):
+        return 'coinmarketcap'
+
+    if first_line == 'date,growth':
+        return 'subscriber'
+
+    if first_line.startswith('time,open,high,low,close'):
+        return 'bars'
+
+    return 'aggregate'
+
+
+def parse_source(file_path: str, kind: str=None) -> dict:
+    """Parses a csv file into named columns, with dates as matplotlib date numbers.
+
+    :param file_path: The path of the file.
+    :param kind: The kind of file (see detect_kind). Defaults to None, meaning it is detected.
+    :return: A dict of column name to np array, always including date.
+    """
+    kind = kind or detect_kind(file_path)
+
+    if kind == 'coinmarketcap':
+        columns = read_price_file(file_path, COINMARKETCAP_COLUMNS)
+        return dict(zip(('date', 'open', 'high', 'low', 'close', 'volume'), columns))
+
+    if kind == 'subscriber':
+        date, growth = read_columns(file_path, {'date': 0, 'growth': 1}, ('growth',), ',', '%Y-%m-%d', reverse=False,
+                                    dtypes={'growth': int})
+        return {'date': date, 'growth': growth}
+
+    if kind == 'aggregate':
+        df = pd.read_csv(file_path, header=None, names=['time', 'price'], dtype={'price': np.float64})
+
+        if np.issubdtype(df['time'].dtype, np.number):
+            times = pd.to_datetime(df['time'].values, unit='s')
+        else:
+            times = pd.to_datetime(df['time'].values)
+
+        return {'date': mdates.date2num(times.values), 'price': df['price'].values}
+
+    if kind == 'bars':
+        df = pd.read_csv(file_path, dtype={'count': np.int64})
+
+        if np.issubdtype(df['time'].dtype, np.number):
+            times = pd.to_datetime(df['time'].values, unit='s')
+        else:
+            times = pd.to_datetime(df['time'].values)
+
+        columns = {name: df[name].values for name in df.columns if name != 'time'}
+        return dict(columns, date=mdates.date2num(times.values))
+
+    if kind == 'npy':
+        bars = read_bars(file_path)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = bars['sum'] / bars['count']
+
+        columns = {name: np.asarray(bars[name]) for name in ('open', 'high', 'low', 'close', 'count', 'volume')}
+        return dict(columns, mean=means, date=mdates.date2num(pd.to_datetime(bars['time'], unit='s').values))
+
+    raise ValueError('kind must be one of "coinmarketcap", "subscriber", "bars", "aggregate" or "npy", got %s instead' %
+                     kind)
+
+
+def to_date_num(date) -> float:
+    """Converts a date (a matplotlib date number, a string, a datetime or a datetime64) to a matplotlib date number."""
+    if date is None or isinstance(date, (int, float, np.floating, np.integer)):
+        return date
+
+    return mdates.date2num(pd.Timestamp(date).to_datetime64())
+
+
+class MarketStore:
+    """A store of csv files converted into memory-mapped columns (one .npy file per column), sorted by date.
+
+    Each source file gets its own directory under the store root. A source is converted again automatically when its
+    size or modification time changes.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _directory(self, source_path: str) -> str:
+        source_path = os.path.abspath(source_path)
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        digest = hashlib.sha1(source_path.encode('utf-8')).hexdigest()[:12]
+
+        return os.path.join(self.root, '%s-%s' % (name, digest))
+
+    @staticmethod
+    def _signature(source_path: str) -> dict:
+        stat = os.stat(source_path)
+
+        return {'source': os.path.abspath(source_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _read_meta(self, directory: str):
+        try:
+            with open(os.path.join(directory, 'meta.json'), 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def is_stale(self, source_path: str) -> bool:
+        """Checks whether a source needs to be converted (again).
+
+        :param source_path: The path of the csv file.
+        :return: True if the source has not been converted or has changed since.
+        """
+        meta = self._read_meta(self._directory(source_path))
+
+        return meta is None or any(meta.get(k) != v for k, v in self._signature(source_path).items())
+
+    def build(self, source_path: str, kind: str=None) -> str:
+        """Converts a csv file into the store.
+
+        :param source_path: The path of the csv file.
+        :param kind: The kind of file (see detect_kind). Defaults to None, meaning it is detected.
+        :return: The directory of the converted columns.
+        """
+        if not os.path.exists(source_path) or not os.path.isfile(source_path):
+            raise FileNotFoundError('File %s does not exist!' % source_path)
+
+        signature = self._signature(source_path)
+        columns = parse_source(source_path, kind)
+
+        order = np.argsort(columns['date'], kind='mergesort')
+        if np.any(np.diff(order) != 1):
+            columns = {name: values[order] for name, values in columns.items()}
+
+        directory = self._directory(source_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write everything under temporary names first so readers never see a half written column
+        for name, values in columns.items():
+            temporary = os.path.join(directory, '%s.npy.tmp' % name)
+            with open(temporary, 'wb') as file:
+                np.save(file, np.ascontiguousarray(values))
+            os.replace(temporary, os.path.join(directory, '%s.npy' % name))
+
+        meta = dict(signature, kind=kind or detect_kind(source_path), columns=list(columns), rows=len(order))
+        temporary = os.path.join(directory, 'meta.json.tmp')
+        with open(temporary, 'w') as file:
+            json.dump(meta, file)
+        os.replace(temporary, os.path.join(directory, 'meta.json'))
+
+        return directory
+
+    def load(self, source_path: str, kind: str=None) -> dict:
+        """Memory-maps every column of a source, converting it first if it is stale.
+
+        :param source_path: The path of the csv file.
+        :param kind: The kind of file (see detect_kind). Defaults to None, meaning it is detected.
+        :return: A dict of column name to read-only memory-mapped np array, sorted by date.
+        """
+        if self.is_stale(source_path):
+            self.build(source_path, kind)
+
+        directory = self._directory(source_path)
+        meta = self._read_meta(directory)
+
+        return {name: np.load(os.path.join(directory, '%s.npy' % name), mmap_mode='r') for name in meta['columns']}
+
+    def query(self, source_path: str, start=None, end=None, columns: tuple=None) -> dict:
+        """Gets the rows of a source between two dates (inclusive) as zero-copy views of the memory-mapped columns.
+
+        :param source_path: The path of the csv file.
+        :param start: The first date (a matplotlib date number, string, datetime or datetime64). Defaults to None,
+            meaning the first row.
+        :param end: The last date. Defaults to None, meaning the last row.
+        :param columns: The names of the columns to return. Defaults to None, meaning all of them.
+        :return: A dict of column name to np array view.
+        """
+        data = self.load(source_path)
+        date = data['date']
+
+        first = 0 if start is None else np.searchsorted(date, to_date_num(start), side='left')
+        last = len(date) if end is None else np.searchsorted(date, to_date_num(end), side='right')
+
+        return {name: data[name][first:last] for name in (columns or data)}
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+
+    if len(args) < 2:
+        print('Specify a store directory followed by the csv files to convert.')
+    else:
+        store = MarketStore(args[0])
+
+        for source_path in args[1:]:
+            if store.is_stale(source_path):
+                print('Converting %s' % source_path)
+                store.build(source_path)
+            else:
+                print('Up to date: %s' % source_path)
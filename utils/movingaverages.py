@@ -1,4 +1,4 @@
-import csv
+from collections import namedtuple
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
@@ -7,43 +7,91 @@ import matplotlib.dates as mdates
 import matplotlib
 import pylab
 import pandas as pd
-import pandas_datareader.data as web
+from cache import cached
+from data_sources import DataSource, default_source, to_columns
+from loader import read_price_file
 
 
-def relative_strength(values, window: int=14):
+# Largest exponent used when scaling values inside _exponential_filter (keeps the scale factors well inside float64)
+_MAX_FILTER_EXPONENT = 500.
+
+
+def _exponential_filter(values, decay, initial):
+    """Computes y[t] = decay * y[t - 1] + (1 - decay) * values[t] for each row of values without a Python loop per
+       value. The series is split into blocks where the recursion is a scaled cumulative sum.
+
+    :param values: A 2d np array with one series per row.
+    :param decay: The decay for each row.
+    :param initial: The value of y[-1] for each row.
+    :return: A 2d np array of the filtered rows.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    rows = max(len(values), np.size(decay))
+    n = values.shape[1]
+    decay = np.broadcast_to(np.asarray(decay, dtype=float).reshape(-1, 1), (rows, 1))
+    state = np.array(np.broadcast_to(np.asarray(initial, dtype=float).reshape(-1, 1), (rows, 1)))
+    filtered = np.empty((rows, n))
+
+    if n == 0:
+        return filtered
+
+    # A decay of 0 means no smoothing at all
+    unsmoothed = decay[:, 0] == 0
+    if np.any(unsmoothed):
+        filtered[unsmoothed] = np.broadcast_to(values, (rows, n))[unsmoothed]
+        smoothed = ~unsmoothed
+        if np.any(smoothed):
+            filtered[smoothed] = _exponential_filter(np.broadcast_to(values, (rows, n))[smoothed], decay[smoothed],
+                                                     state[smoothed])
+        return filtered
+
+    block = int(_MAX_FILTER_EXPONENT / -np.log(decay).min())
+    block = min(max(block, 1), n)
+    powers = decay ** np.arange(1, block + 1)
+
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        p = powers[:, :stop - start]
+
+        # y[start + j] = decay^(j + 1) * (state + (1 - decay) * sum(values[start + i] / decay^(i + 1), i <= j))
+        scaled = np.cumsum(values[:, start:stop] / p, axis=1)
+        filtered[:, start:stop] = p * (state + (1 - decay) * scaled)
+        state = filtered[:, stop - 1:stop]
+
+    return filtered
+
+
+@cached
+def relative_strength(values, window=14):
     """Computes the relative strength indicator (RSI) for the given values and window.
 
     :param values: The values.
-    :param window: The window for the RSI.
-    :return: An np array of the RSI.
+    :param window: The window for the RSI, or a list of windows to compute at once.
+    :return: An np array of the RSI, or a 2d np array with one row per window if a list of windows was given.
     """
+    if np.ndim(window) > 0:
+        return np.array([relative_strength(values, w) for w in window]).reshape(-1, len(values))
+
     deltas = np.diff(values)
     seed = deltas[:window + 1]
     up = seed[seed >= 0].sum() / window
     down = -seed[seed < 0].sum() / window
-    rs = up / down
-    rsi = np.zeros_like(values)
-    rsi[:window] = 100. - 100. / (1. + rs)
-
-    for i in range(window, len(values)):
-        delta = deltas[i - 1]  # cause the diff is 1 shorter
+    rsi = np.zeros_like(values, dtype=float)
 
-        if delta > 0:
-            upval = delta
-            downval = 0.
-        else:
-            upval = 0.
-            downval = -delta
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi[:window] = 100. - 100. / (1. + up / down)
 
-        up = (up * (window - 1) + upval) / window
-        down = (down * (window - 1) + downval) / window
-
-        rs = up / down
-        rsi[i] = 100. - 100. / (1. + rs)
+        if len(values) > window:
+            # Wilder smoothing, with rsi[i] using deltas[i - 1] (the diff is 1 shorter)
+            smoothing = deltas[window - 1:]
+            smoothed = _exponential_filter([np.maximum(smoothing, 0.), np.maximum(-smoothing, 0.)],
+                                           (window - 1.) / window, [up, down])
+            rsi[window:] = 100. - 100. / (1. + smoothed[0] / smoothed[1])
 
     return rsi
 
 
+@cached
 def moving_average(values, window):
     """Computes the simple moving average over a set of values for a given window.
 
@@ -56,20 +104,29 @@ def moving_average(values, window):
     return sma
 
 
+@cached
 def exp_moving_average(values, window):
-    """Computes the exponential moving average over a set of values for a given window.
+    """Computes the exponential moving average over a set of values for a given window, using the recursive form
+       ema[t] = alpha * values[t] + (1 - alpha) * ema[t - 1] with alpha = 2 / (window + 1) and ema[0] = values[0].
 
     :param values: The values to perform the moving average over.
-    :param window: The size of the moving average window.
-    :return: An np array of the exponential moving average.
+    :param window: The size (span) of the moving average window, or a list of windows to compute at once.
+    :return: An np array of the exponential moving average, or a 2d np array with one row per window if a list of
+        windows was given.
     """
-    weights = np.exp(np.linspace(-1., 0., window))
-    weights /= weights.sum()
-    ema = np.convolve(values, weights, mode='full')[:len(values)]
-    ema[:window] = ema[window]
-    return ema
+    values = np.asarray(values, dtype=float)
+    windows = np.asarray(window, dtype=float)
 
+    if len(values) == 0:
+        return np.empty(windows.shape + (0,))
 
+    decay = 1. - 2. / (windows + 1.)
+    ema = _exponential_filter(values, decay, values[0])
+
+    return ema if windows.ndim > 0 else ema[0]
+
+
+@cached
 def moving_average_convergence(values, slow_window: int, fast_window: int):
     """Computes the MACD (Moving Average Convergence / Divergence) for exponential moving average.
 
@@ -78,8 +135,7 @@ def moving_average_convergence(values, slow_window: int, fast_window: int):
     :param fast_window: The window for the fast moving average.
     :return: Returns a tuple of (slow moving average, fast moving average, and macd).
     """
-    mas = exp_moving_average(values, slow_window)
-    maf = exp_moving_average(values, fast_window)
+    mas, maf = exp_moving_average(values, [slow_window, fast_window])
 
     return mas, maf, maf - mas
 
@@ -98,56 +154,39 @@ def read_file(file_path: str, column_map: dict, delimiter: str=';', dt_format: s
     :param num_rows: The number of rows that should be kept.
     :return: A tuple of np arrays (date, open_price, high_price, low_price, close_price, volume).
     """
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file, delimiter=delimiter)
-
-        if reader is None:
-            raise ValueError('File %s is not a valid csv!' % file_path)
-
-        data = list(reader)
-
-        if header:
-            data = data[1:]
-
-        if reverse:
-            data = list(reversed(data))
+    return read_price_file(file_path, column_map, delimiter, dt_format, header, reverse, num_rows)
 
-        if num_rows > -1:
-            data = data[-num_rows:]
 
-        n = np.array(data)
-
-        def datefix(d: str):
-            d = d.replace('v', '/')
-
-            return mdates.strpdate2num(dt_format)(d)
-
-        date = np.array(list(map(datefix, n[:, column_map['date']])))
-        open_price = np.array(n[:, column_map['open']], dtype=float)
-        high_price = np.array(n[:, column_map['high']], dtype=float)
-        low_price = np.array(n[:, column_map['low']], dtype=float)
-        close_price = np.array(n[:, column_map['close']], dtype=float)
-        volume = np.array(n[:, column_map['volume']], dtype=float)
-
-        return date, open_price, high_price, low_price, close_price, volume
-
-
-def read_stock(stock_name: str, start_date: str, end_date: str=None):
-    """Retrieves stock information from "iex".
+def read_stock(stock_name: str, start_date: str, end_date: str=None, source: DataSource=None):
+    """Retrieves stock information from "iex" (through a local cache, so only dates that haven't been fetched before
+       are requested).
 
     :param stock_name: The name of the stock.
     :param start_date: The start date of the stock. Should be %Y-%m-%d format.
     :param end_date: The end date of the stock. Should be %Y-%m-%d format. Defaults to None, meaning today.
-    :return:
+    :param source: The data source. Defaults to None, meaning data_sources.default_source().
+    :return: A tuple of np arrays (date, open_price, high_price, low_price, close_price, volume).
     """
-    df = web.DataReader(stock_name, 'iex', start_date, end_date)
+    return read_stocks([stock_name], start_date, end_date, source)[stock_name]
 
-    return (np.array(list(map(mdates.strpdate2num('%Y-%m-%d'), df.index))),
-            np.array(df['open'], dtype=float),
-            np.array(df['high'], dtype=float),
-            np.array(df['low'], dtype=float),
-            np.array(df['close'], dtype=float),
-            np.array(df['volume'], dtype=float))
+
+def read_stocks(stock_names: list, start_date: str, end_date: str=None, source: DataSource=None) -> dict:
+    """Retrieves the stock information of several stocks at once (see read_stock).
+
+    :param stock_names: The names of the stocks.
+    :param start_date: The start date of the stocks. Should be %Y-%m-%d format.
+    :param end_date: The end date of the stocks. Should be %Y-%m-%d format. Defaults to None, meaning today.
+    :param source: The data source. Defaults to None, meaning data_sources.default_source().
+    :return: A dict of stock name to tuple of np arrays (date, open_price, high_price, low_price, close_price, volume).
+    """
+    source = source or default_source()
+    frames = source.fetch(list(stock_names), start_date, end_date)
+
+    missing = [name for name in stock_names if name not in frames]
+    if missing:
+        raise ValueError('No data found for %s between %s and %s' % (', '.join(missing), start_date, end_date))
+
+    return {name: to_columns(df) for name, df in frames.items()}
 
 
 def graph_moving_averages(data_name: str, values: tuple, maw1: int, maw2: int, ma_type='simple'):
@@ -285,10 +324,74 @@ def graph_macd(data_name: str, values: tuple):
     plt.show()
 
 
+# The result of a simulated strategy. equity is the value of the investment at the end of each day.
+StrategyResult = namedtuple('StrategyResult', ['investment', 'earnings', 'equity', 'trades'])
+
+# A trade ledger, with one entry per trade in each np array.
+Trades = namedtuple('Trades', ['entry_index', 'exit_index', 'entry_date', 'exit_date', 'entry_price', 'exit_price',
+                               'returns'])
+
+
+def holding_positions(short_ma: np.ndarray, long_ma: np.ndarray) -> np.ndarray:
+    """Computes whether the moving average crossover strategy is holding coins at the end of each day. The strategy
+       starts holding, sells when the stance goes straight from 1 to -1 and buys when it goes from -1 to 1.
+
+    :param short_ma: The short moving averages, one row per strategy.
+    :param long_ma: The long moving averages, one row per strategy.
+    :return: A 2d boolean np array, True where coins are held.
+    """
+    with np.errstate(invalid='ignore'):
+        stance = np.nan_to_num(np.sign(np.atleast_2d(short_ma) - np.atleast_2d(long_ma)))
+
+    events = np.zeros(stance.shape)
+    events[:, 0] = 2  # Holding from day 1
+    events[:, 1:] = np.diff(stance, axis=1)
+    events[np.abs(events) != 2] = 0
+
+    # The position is set by the most recent buy (+2) or sell (-2)
+    last_event = np.where(events != 0, np.arange(stance.shape[1]), 0)
+    np.maximum.accumulate(last_event, axis=1, out=last_event)
+
+    return events[np.arange(len(events))[:, np.newaxis], last_event] > 0
+
+
+def strategy_returns(prices: np.ndarray, holding: np.ndarray) -> np.ndarray:
+    """Computes the daily log returns of a strategy that holds coins at the end of the days given by holding.
+
+    :param prices: The prices.
+    :param holding: A 2d boolean np array, True where coins are held (see holding_positions).
+    :return: A 2d np array of log returns, with the first day being 0.
+    """
+    log_returns = np.zeros(holding.shape)
+    log_returns[:, 1:] = np.where(holding[:, :-1], np.diff(np.log(prices)), 0.)
+
+    return log_returns
+
+
+def trade_ledger(prices: np.ndarray, holding: np.ndarray, dates: np.ndarray=None) -> Trades:
+    """Builds the trade ledger for a single strategy. A position still held on the last day is closed on that day.
+
+    :param prices: The prices.
+    :param holding: A boolean np array, True where coins are held (see holding_positions).
+    :param dates: The dates of the prices. Defaults to None, meaning the day indices are used.
+    :return: The trades.
+    """
+    held = np.concatenate(([False], holding, [False])).astype(int)
+    changes = np.diff(held)
+    entry_index = np.flatnonzero(changes == 1)
+    exit_index = np.minimum(np.flatnonzero(changes == -1), len(prices) - 1)
+
+    if dates is None:
+        dates = np.arange(len(prices))
+
+    return Trades(entry_index, exit_index, dates[entry_index], dates[exit_index], prices[entry_index],
+                  prices[exit_index], prices[exit_index] / prices[entry_index] - 1.)
+
+
 def simulate_moving_average(df: pd.DataFrame, maw1: int, maw2: int, column: str='open', investment: int=10000,
-                            ma_type: str='simple', show_graph: bool=False):
+                            ma_type: str='simple', show_graph: bool=False) -> StrategyResult:
     """Computes the moving average strategy, which simulates buying and selling at the crossover points between two
-       moving averages (assuming you invest at day 1 and stop on the last day).
+       moving averages (assuming you invest at day 1 and stop on the last day). The data frame is not modified.
 
     :param df: A panda dataframe of the data.
     :param maw1: The short moving average window.
@@ -297,54 +400,33 @@ def simulate_moving_average(df: pd.DataFrame, maw1: int, maw2: int, column: str=
     :param investment: The initial investment.
     :param ma_type: The type of moving average, either "simple" or "exponential".
     :param show_graph: Whether the show the stance graph.
+    :return: The result of the strategy, with the trades dated by the data frame index.
     """
+    prices = np.asarray(df[column].values, dtype=float)
+
     if ma_type == 'simple':
-        df['mas'] = np.round(df[column].rolling(window=maw1).mean(), 2)
-        df['mab'] = np.round(df[column].rolling(window=maw2).mean(), 2)
+        mas = np.round(df[column].rolling(window=maw1).mean().values, 2)
+        mab = np.round(df[column].rolling(window=maw2).mean().values, 2)
     elif ma_type == 'exponential':
-        df['mas'] = np.round(df[column].ewm(span=maw1, adjust=False).mean(), 2)
-        df['mab'] = np.round(df[column].ewm(span=maw2, adjust=False).mean(), 2)
+        mas, mab = np.round(exp_moving_average(prices, [maw1, maw2]), 2)
     else:
         raise ValueError('ma_type must be either "simple" or "exponential", got %s instead' % ma_type)
 
-    df['diff'] = df['mas'] - df['mab']
-
-    threshold = 0
-    df['Stance'] = np.where(df['diff'] > threshold, 1, 0)
-    df['Stance'] = np.where(df['diff'] < threshold, -1, df['Stance'])
-    df['Market Returns'] = np.log(df[column] / df[column].shift(1))
-    df['Strategy'] = df['Market Returns'] * df['Stance'].shift(1)
-
-    df['Stance Diff'] = df['Stance'].diff()
-
-    # Simulate investments
-    earnings = investment / df[column][0]
-    waiting_to_sell = True
-    for day, sd in enumerate(df['Stance Diff']):
-        if sd == -2 and waiting_to_sell:
-            earnings *= df[column][day]  # Trade coins for $
-            waiting_to_sell = False
-        elif sd == 2 and not waiting_to_sell:
-            earnings /= df[column][day]  # Trade $ for coins
-            waiting_to_sell = True
-
-    if waiting_to_sell:
-        earnings *= df[column][df[column].size - 1]
-
-    print('Moving Average Strategy')
-    print('Initial Investment: %s' % investment)
-    print('Ending investment:  %s' % earnings)
-    print('Absolute Returns:   %s' % (earnings - investment))
-    print('Relative Returns:   %%%s' % (((earnings - investment) / investment) * 100))
+    holding = holding_positions(mas, mab)
+    equity = investment * np.exp(np.cumsum(strategy_returns(prices, holding)[0]))
+    result = StrategyResult(investment, equity[-1], equity, trade_ledger(prices, holding[0], df.index.values))
 
     if show_graph:
         # Plot stances
+        with np.errstate(invalid='ignore'):
+            stance = np.nan_to_num(np.sign(mas - mab))
+
         fig = plt.figure(figsize=(15, 9))
         ax = fig.add_subplot(2, 1, 1)
 
-        ax.plot(df.ix[:, :].index, df.ix[:, column], label='Open')
-        ax.plot(df.ix[:, :].index, df.ix[:, 'mas'], label='Short %s' % maw1)
-        ax.plot(df.ix[:, :].index, df.ix[:, 'mab'], label='Long %s' % maw2)
+        ax.plot(df.index, prices, label='Open')
+        ax.plot(df.index, mas, label='Short %s' % maw1)
+        ax.plot(df.index, mab, label='Long %s' % maw2)
 
         ax.set_ylabel('$')
         ax.legend(loc='best')
@@ -352,29 +434,42 @@ def simulate_moving_average(df: pd.DataFrame, maw1: int, maw2: int, column: str=
 
         ax = fig.add_subplot(2, 1, 2)
 
-        ax.plot(df.ix[:, :].index, df.ix[:, 'Stance'], label='Stance')
+        ax.plot(df.index, stance, label='Stance')
         ax.set_ylabel('Trading position')
 
         plt.show()
 
+    return result
 
-def buy_and_hold(df: pd.DataFrame, column: str='open', investment: int = 10000):
+
+def buy_and_hold(df: pd.DataFrame, column: str='open', investment: int = 10000) -> StrategyResult:
     """Computes the buy and hold strategy, which just looks a the starting and end value (assuming you invest at
         day 1 and stop today).
 
     :param df: A panda dataframe of the data.
     :param column: The name of the price column in the data frame. Defaults to "open".
     :param investment: The initial investment.
+    :return: The result of the strategy, with the trades dated by the data frame index.
     """
-    start = float(df[column][0])
-    end = float(df[column][df[column].size-1])
-    earnings = (investment / start) * end
+    prices = np.asarray(df[column].values, dtype=float)
+    equity = (investment / prices[0]) * prices
+    holding = np.ones(len(prices), dtype=bool)
+
+    return StrategyResult(investment, equity[-1], equity, trade_ledger(prices, holding, df.index.values))
 
-    print('Buy and Hold Strategy')
-    print('Initial Investment:  %s' % investment)
-    print('Ending Investment:   %s' % earnings)
-    print('Absolute Returns:    %s' % (earnings - investment))
-    print('Relative Returns:    %%%s' % (((earnings - investment) / investment) * 100))
+
+def print_strategy(name: str, result: StrategyResult):
+    """Prints the results of a strategy.
+
+    :param name: The name of the strategy.
+    :param result: The result of the strategy.
+    """
+    print(name)
+    print('Initial Investment: %s' % result.investment)
+    print('Ending Investment:  %s' % result.earnings)
+    print('Absolute Returns:   %s' % (result.earnings - result.investment))
+    print('Relative Returns:   %%%s' % (((result.earnings - result.investment) / result.investment) * 100))
+    print('Trades:             %s' % len(result.trades.returns))
 
 
 if __name__ == '__main__':
@@ -392,6 +487,7 @@ if __name__ == '__main__':
 
     df = pd.DataFrame(close_price, columns=['close'])
 
-    simulate_moving_average(df, 5, 20, column='close', ma_type='exponential', show_graph=True)
+    print_strategy('Moving Average Strategy',
+                   simulate_moving_average(df, 5, 20, column='close', ma_type='exponential', show_graph=True))
 
-    buy_and_hold(df, column='close')
+    print_strategy('Buy and Hold Strategy', buy_and_hold(df, column='close'))
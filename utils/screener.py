@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+from collections import namedtuple
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from movingaverages import exp_moving_average, moving_average_convergence, read_file, relative_strength
+
+COINMARKETCAP_COLUMNS = {'date': 0, 'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5}
+
+# Wall-clock time and throughput of a screen
+ScreenStats = namedtuple('ScreenStats', ['files', 'rows', 'seconds', 'files_per_second', 'rows_per_second'])
+
+
+def indicator_state(close_price: np.ndarray, maw1: int=5, maw2: int=20, rsi_window: int=14) -> dict:
+    """Computes the latest crossover, MACD and RSI state of a price series.
+
+    :param close_price: The closing prices.
+    :param maw1: The short moving average window.
+    :param maw2: The long moving average window.
+    :param rsi_window: The window for the RSI.
+    :return: A dict with the last price, the crossover stance and spread (short MA relative to the long MA), the number
+        of days since the stance last changed, the MACD histogram relative to the price and the RSI.
+    """
+    short_ma, long_ma = exp_moving_average(close_price, [maw1, maw2])
+
+    stance = np.sign(short_ma - long_ma)
+    changes = np.flatnonzero(np.diff(stance))
+
+    _, _, macd = moving_average_convergence(close_price, 26, 12)
+    histogram = macd - exp_moving_average(macd, 9)
+
+    return {
+        'rows': len(close_price),
+        'price': close_price[-1],
+        'stance': int(stance[-1]),
+        'spread': (short_ma[-1] - long_ma[-1]) / long_ma[-1],
+        'days_since_cross': len(stance) - 1 - (changes[-1] + 1 if len(changes) else 0),
+        'macd_histogram': histogram[-1] / close_price[-1],
+        'rsi': relative_strength(close_price, rsi_window)[-1],
+    }
+
+
+def _screen_file(args: tuple) -> tuple:
+    file_path, maw1, maw2, rsi_window = args
+
+    _, _, _, _, close_price, _ = read_file(file_path, COINMARKETCAP_COLUMNS)
+
+    return os.path.splitext(os.path.basename(file_path))[0], indicator_state(close_price, maw1, maw2, rsi_window)
+
+
+def screen(directory_path: str, maw1: int=5, maw2: int=20, rsi_window: int=14, processes: int=None) -> tuple:
+    """Loads every coin in a directory of coinmarketcap csv files and ranks them by the strength of their crossover,
+       MACD and RSI signals.
+
+    The signal strength is the average of each coin's percentile rank (centered on 0) for the crossover spread, the
+    MACD histogram and the RSI, so it runs from -0.5 (most bearish) to 0.5 (most bullish).
+
+    :param directory_path: The directory of csv files.
+    :param maw1: The short moving average window.
+    :param maw2: The long moving average window.
+    :param rsi_window: The window for the RSI.
+    :param processes: The number of worker processes. Defaults to None, meaning one per CPU.
+    :return: A tuple of (data frame with a row per coin sorted by signal strength, ScreenStats).
+    """
+    if not os.path.exists(directory_path) or not os.path.isdir(directory_path):
+        raise FileNotFoundError('Directory %s does not exist!' % directory_path)
+
+    file_paths = [os.path.join(directory_path, f) for f in sorted(os.listdir(directory_path)) if f.endswith('.csv')]
+
+    start = time.perf_counter()
+
+    with Pool(processes) as pool:
+        states = pool.map(_screen_file, [(f, maw1, maw2, rsi_window) for f in file_paths])
+
+    table = pd.DataFrame([state for _, state in states], index=[coin for coin, _ in states])
+    table.index.name = 'coin'
+
+    if len(table):
+        ranks = table[['spread', 'macd_histogram', 'rsi']].rank(pct=True) - 0.5
+        table['strength'] = ranks.mean(axis=1)
+        table = table.sort_values('strength', ascending=False)
+
+    seconds = time.perf_counter() - start
+    rows = int(table['rows'].sum()) if len(table) else 0
+    stats = ScreenStats(len(file_paths), rows, seconds, len(file_paths) / seconds, rows / seconds)
+
+    return table, stats
+
+
+if __name__ == '__main__':
+    directory_path = sys.argv[1] if len(sys.argv) > 1 else '../data/coinmarketcap'
+
+    table, stats = screen(directory_path)
+
+    print(table.to_string())
+    print('Screened %s files (%s rows) in %.2fs: %.1f files/s, %.0f rows/s' % stats)
@@ -0,0 +1,196 @@
+from collections import deque
+
+import numpy as np
+
+
+class StreamingSMA:
+    """Simple moving average that is updated one price at a time.
+
+    Matches moving_average (in movingaverages.py) once the window is full; before then the value is nan.
+    """
+
+    def __init__(self, window: int):
+        if window < 1:
+            raise ValueError('window must be at least 1, got %s instead' % window)
+
+        self.window = window
+        self.value = np.nan
+        self._buffer = deque(maxlen=window)
+        self._sum = 0.0
+        self._updates = 0
+
+    def update(self, price: float) -> float:
+        """Adds a price to the average.
+
+        :param price: The new price.
+        :return: The updated moving average (nan until the window is full).
+        """
+        price = float(price)
+
+        if len(self._buffer) == self.window:
+            self._sum -= self._buffer[0]
+
+        self._buffer.append(price)
+        self._sum += price
+        self._updates += 1
+
+        # Re-sum the window every so often so the running sum doesn't drift
+        if self._updates % self.window == 0:
+            self._sum = sum(self._buffer)
+
+        if len(self._buffer) == self.window:
+            self.value = self._sum / self.window
+
+        return self.value
+
+    def update_batch(self, prices) -> np.ndarray:
+        """Adds several prices to the average.
+
+        :param prices: The new prices.
+        :return: An np array of the moving average after each price.
+        """
+        return np.array([self.update(price) for price in prices], dtype=float)
+
+
+class StreamingEMA:
+    """Exponential moving average that is updated one price at a time.
+
+    Uses the recursive form ema = alpha * price + (1 - alpha) * ema with alpha = 2 / (span + 1), seeded with the first
+    price, so it matches exp_moving_average (in movingaverages.py).
+    """
+
+    def __init__(self, span: int):
+        if span < 1:
+            raise ValueError('span must be at least 1, got %s instead' % span)
+
+        self.span = span
+        self.alpha = 2. / (span + 1.)
+        self.value = np.nan
+
+    def update(self, price: float) -> float:
+        """Adds a price to the average.
+
+        :param price: The new price.
+        :return: The updated exponential moving average.
+        """
+        price = float(price)
+
+        if np.isnan(self.value):
+            self.value = price
+        else:
+            self.value += self.alpha * (price - self.value)
+
+        return self.value
+
+    def update_batch(self, prices) -> np.ndarray:
+        """Adds several prices to the average.
+
+        :param prices: The new prices.
+        :return: An np array of the exponential moving average after each price.
+        """
+        return np.array([self.update(price) for price in prices], dtype=float)
+
+
+class StreamingMACD:
+    """MACD (Moving Average Convergence / Divergence) with a signal line that is updated one price at a time.
+
+    The macd matches moving_average_convergence (in movingaverages.py) and the signal matches exp_moving_average of it.
+    """
+
+    def __init__(self, slow_window: int=26, fast_window: int=12, signal_window: int=9):
+        self.slow = StreamingEMA(slow_window)
+        self.fast = StreamingEMA(fast_window)
+        self.signal = StreamingEMA(signal_window)
+        self.value = (np.nan, np.nan, np.nan)
+
+    def update(self, price: float) -> tuple:
+        """Adds a price to the MACD.
+
+        :param price: The new price.
+        :return: A tuple of (macd, signal, histogram).
+        """
+        macd = self.fast.update(price) - self.slow.update(price)
+        signal = self.signal.update(macd)
+        self.value = (macd, signal, macd - signal)
+
+        return self.value
+
+    def update_batch(self, prices) -> np.ndarray:
+        """Adds several prices to the MACD.
+
+        :param prices: The new prices.
+        :return: An np array of shape (len(prices), 3) with the (macd, signal, histogram) after each price.
+        """
+        return np.array([self.update(price) for price in prices], dtype=float).reshape(-1, 3)
+
+
+class StreamingRSI:
+    """Relative strength indicator (RSI) with Wilder smoothing that is updated one price at a time.
+
+    The first window + 2 prices are buffered to seed the averages the same way relative_strength (in
+    movingaverages.py) does, so from that point on the values match relative_strength. Before then the value is nan.
+    """
+
+    def __init__(self, window: int=14):
+        if window < 1:
+            raise ValueError('window must be at least 1, got %s instead' % window)
+
+        self.window = window
+        self.value = np.nan
+        self._seed = []
+        self._previous = None
+        self._up = 0.
+        self._down = 0.
+
+    def _smooth(self, delta: float):
+        upval = delta if delta > 0 else 0.
+        downval = -delta if delta <= 0 else 0.
+
+        self._up = (self._up * (self.window - 1) + upval) / self.window
+        self._down = (self._down * (self.window - 1) + downval) / self.window
+
+    def _rsi(self) -> float:
+        if self._down == 0:
+            return 100. if self._up > 0 else np.nan
+
+        return 100. - 100. / (1. + self._up / self._down)
+
+    def update(self, price: float) -> float:
+        """Adds a price to the RSI.
+
+        :param price: The new price.
+        :return: The updated RSI (nan until the seed is complete).
+        """
+        price = float(price)
+
+        if self._seed is not None:
+            self._seed.append(price)
+
+            if len(self._seed) < self.window + 2:
+                return self.value
+
+            deltas = np.diff(self._seed)
+            self._up = deltas[deltas >= 0].sum() / self.window
+            self._down = -deltas[deltas < 0].sum() / self.window
+
+            # relative_strength reuses the last seed deltas for its first two smoothing steps
+            self._smooth(deltas[self.window - 1])
+            self._smooth(deltas[self.window])
+
+            self._previous = price
+            self._seed = None
+        else:
+            self._smooth(price - self._previous)
+            self._previous = price
+
+        self.value = self._rsi()
+
+        return self.value
+
+    def update_batch(self, prices) -> np.ndarray:
+        """Adds several prices to the RSI.
+
+        :param prices: The new prices.
+        :return: An np array of the RSI after each price.
+        """
+        return np.array([self.update(price) for price in prices], dtype=float)
@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import cache
+from cache import IndicatorCache, cache_key
+
+
+class IndicatorCacheTest(unittest.TestCase):
+
+    def test_oversized_value_skips_memory(self):
+        cache = IndicatorCache(memory_limit=1000)
+        cache.put('small', np.zeros(10))
+        cache.put('big', np.zeros(1000))
+
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.stats()['bytes'], 80)
+        self.assertFalse(cache.get('big')[0])
+        self.assertTrue(cache.get('small')[0])
+
+    def test_oversized_value_replaces_entry(self):
+        cache = IndicatorCache(memory_limit=1000)
+        cache.put('key', np.zeros(10))
+        cache.put('key', np.zeros(1000))
+
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_miss_returns_result_and_caches_copy(self):
+        cache = IndicatorCache()
+        results = []
+
+        @cache.memoize
+        def double(values):
+            results.append(values * 2)
+            return results[-1]
+
+        values = np.arange(5.)
+        first = double(values)
+        self.assertIs(first, results[0])
+
+        first[:] = 0
+        second = double(values)
+        self.assertEqual(len(results), 1)
+        np.testing.assert_array_equal(second, values * 2)
+
+        second[:] = 0
+        np.testing.assert_array_equal(double(values), values * 2)
+
+    def test_key_changes_with_code(self):
+        def scale(values, factor=2):
+            return values * factor
+
+        key = cache_key(scale, (np.arange(3.),), {})
+        self.assertEqual(cache_key(scale, (np.arange(3.),), {}), key)
+
+        def changed(values, factor=2):
+            return values * factor + 1
+        changed.__qualname__ = scale.__qualname__
+        self.assertNotEqual(cache_key(changed, (np.arange(3.),), {}), key)
+
+        version = cache.CACHE_VERSION
+        try:
+            cache.CACHE_VERSION += 1
+            self.assertNotEqual(cache_key(scale, (np.arange(3.),), {}), key)
+        finally:
+            cache.CACHE_VERSION = version
+
+    def test_disk_hit_survives_eviction_race(self):
+        directory = tempfile.mkdtemp()
+        try:
+            IndicatorCache(disk_directory=directory).put('key', np.arange(3.))
+            fresh = IndicatorCache(disk_directory=directory)
+
+            with mock.patch('cache.os.utime', side_effect=FileNotFoundError()):
+                found, value = fresh.get('key')
+
+            self.assertTrue(found)
+            np.testing.assert_array_equal(value, np.arange(3.))
+            self.assertEqual(fresh.stats()['disk_hits'], 1)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from csv_aggregate import (Interval, OutOfOrderError, aggregate_directory, aggregate_directory_bars,
+                           aggregate_incremental, aggregate_rollup, aggregate_stream, create_bar_file, create_file,
+                           input_files, stream_bars, stream_ticks)
+
+
+def write_ticks(file_path: str, times: pd.DatetimeIndex, seed: int):
+    random = np.random.RandomState(seed)
+    pd.DataFrame({'timestamp': times.strftime('%Y-%m-%d %H:%M:%S'),
+                  'amount': np.round(random.normal(0., 1., len(times)), 4),
+                  'price': np.round(1000. + np.cumsum(random.normal(0., 1., len(times))), 2)},
+                 columns=['timestamp', 'amount', 'price']).to_csv(file_path, index=False)
+
+
+class OutOfOrderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_directory = os.path.join(self.directory, 'ticks')
+        os.makedirs(self.input_directory)
+
+        # The second file starts with ticks from the middle of the first one
+        first = pd.date_range('2017-03-01', periods=5000, freq='17s')
+        second = first[2500:2600].append(pd.date_range(first[-1], periods=5000, freq='13s'))
+        write_ticks(os.path.join(self.input_directory, 'a.csv'), first, 0)
+        write_ticks(os.path.join(self.input_directory, 'b.csv'), second, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def test_stream_bars_raises(self):
+        with self.assertRaises(OutOfOrderError):
+            list(stream_bars(stream_ticks(input_files(self.input_directory)), Interval.Minute))
+
+    def test_stream_matches_parallel(self):
+        file_paths = input_files(self.input_directory)
+
+        create_bar_file(self.path('parallel_bars.csv'), aggregate_directory_bars(self.input_directory, Interval.Minute,
+                                                                                 processes=1), Interval.Minute)
+        stats = aggregate_stream(file_paths, self.path('stream_bars.csv'), Interval.Minute, bars=True)
+        pd.testing.assert_frame_equal(pd.read_csv(self.path('stream_bars.csv')),
+                                      pd.read_csv(self.path('parallel_bars.csv')))
+        self.assertEqual(stats.ticks, 10100)
+
+        create_file(self.path('parallel.csv'), aggregate_directory(self.input_directory, Interval.Hour, processes=1))
+        aggregate_stream(file_paths, self.path('stream.csv'), Interval.Hour)
+        with open(self.path('stream.csv')) as stream, open(self.path('parallel.csv')) as parallel:
+            self.assertEqual(stream.read(), parallel.read())
+
+    def test_rollup_matches_parallel(self):
+        aggregate_rollup(input_files(self.input_directory), {Interval.Minute: self.path('rollup_minute.csv'),
+                                                             Interval.Hour: self.path('rollup_hour.csv')}, bars=True)
+
+        for interval, name in ((Interval.Minute, 'minute'), (Interval.Hour, 'hour')):
+            create_bar_file(self.path('parallel.csv'), aggregate_directory_bars(self.input_directory, interval,
+                                                                                processes=1), interval)
+            pd.testing.assert_frame_equal(pd.read_csv(self.path('rollup_%s.csv' % name)),
+                                          pd.read_csv(self.path('parallel.csv')), check_exact=False, rtol=1e-12)
+
+    def test_incremental_rebuilds_on_overlap(self):
+        incremental_directory = self.path('incremental')
+        os.makedirs(incremental_directory)
+        shutil.copy(os.path.join(self.input_directory, 'a.csv'), incremental_directory)
+
+        for bars, name in ((True, 'bars.csv'), (False, 'points.csv'), (True, 'bars.npy')):
+            aggregate_incremental(incremental_directory, self.path(name), Interval.Minute, bars=bars)
+
+        # b.csv starts with ticks from the middle of a.csv, before the bars already written
+        shutil.copy(os.path.join(self.input_directory, 'b.csv'), incremental_directory)
+
+        for bars, name in ((True, 'bars.csv'), (False, 'points.csv'), (True, 'bars.npy')):
+            stats = aggregate_incremental(incremental_directory, self.path(name), Interval.Minute, bars=bars)
+            aggregate_stream(input_files(incremental_directory), self.path('stream_' + name), Interval.Minute, bars=bars)
+            self.assertEqual(stats.ticks, 10100)
+
+            with open(self.path(name), 'rb') as incremental, open(self.path('stream_' + name), 'rb') as stream:
+                self.assertEqual(incremental.read(), stream.read())
+
+        # Later runs carry on from the rebuilt manifest
+        write_ticks(os.path.join(incremental_directory, 'c.csv'), pd.date_range('2017-03-03', periods=500, freq='7s'),
+                    2)
+
+        for bars, name in ((True, 'bars.csv'), (False, 'points.csv'), (True, 'bars.npy')):
+            stats = aggregate_incremental(incremental_directory, self.path(name), Interval.Minute, bars=bars)
+            aggregate_stream(input_files(incremental_directory), self.path('stream_' + name), Interval.Minute, bars=bars)
+            self.assertEqual(stats.ticks, 500)
+
+            with open(self.path(name), 'rb') as incremental, open(self.path('stream_' + name), 'rb') as stream:
+                self.assertEqual(incremental.read(), stream.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from data_sources import PRICE_COLUMNS, CachedSource, DataSource, LocalFileSource
+
+
+class CountingSource(DataSource):
+    """A LocalFileSource that records the ranges it is asked for."""
+
+    def __init__(self, directory_path: str):
+        self.local = LocalFileSource(directory_path)
+        self.requests = []
+
+    def fetch(self, symbols: list, start_date, end_date=None) -> dict:
+        self.requests.append((tuple(symbols), pd.Timestamp(start_date), pd.Timestamp(end_date)))
+        return self.local.fetch(symbols, start_date, end_date)
+
+
+class StubSource(DataSource):
+    """Makes up daily prices for any range, after returning the queued responses (None meaning no data, a date meaning
+       only the prices up to that date).
+    """
+
+    def __init__(self, responses: list=()):
+        self.responses = list(responses)
+        self.requests = []
+
+    def fetch(self, symbols: list, start_date, end_date=None) -> dict:
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        self.requests.append((tuple(symbols), start, end))
+
+        if self.responses:
+            response = self.responses.pop(0)
+            if response is None:
+                return {}
+            end = min(end, pd.Timestamp(response))
+
+        dates = pd.date_range(start, end, freq='D', name='date')
+        prices = pd.DataFrame(np.ones((len(dates), len(PRICE_COLUMNS))), index=dates, columns=PRICE_COLUMNS)
+
+        return {symbol: prices for symbol in symbols}
+
+
+class CachedSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        remote_directory = os.path.join(self.directory, 'remote')
+        os.makedirs(remote_directory)
+
+        dates = pd.date_range('2018-01-01', '2018-12-31', freq='D', name='date')
+        prices = pd.DataFrame(np.arange(len(dates) * len(PRICE_COLUMNS), dtype=float).reshape(len(dates), -1),
+                              index=dates, columns=PRICE_COLUMNS)
+        prices.to_csv(os.path.join(remote_directory, 'AAPL.csv'))
+
+        self.remote = CountingSource(remote_directory)
+        self.source = CachedSource(self.remote, os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_disjoint_request_then_gap(self):
+        self.source.fetch(['AAPL'], '2018-01-01', '2018-01-31')
+        self.source.fetch(['AAPL'], '2018-06-01', '2018-06-30')
+
+        # The later request is extended back to the cached range, so nothing is left uncovered in between
+        self.assertEqual(self.remote.requests[-1][1:], (pd.Timestamp('2018-02-01'), pd.Timestamp('2018-06-30')))
+
+        march = self.source.fetch(['AAPL'], '2018-03-01', '2018-03-31')['AAPL']
+        self.assertEqual(len(self.remote.requests), 2)
+        self.assertEqual(len(march), 31)
+
+    def test_earlier_request_extends_forward(self):
+        self.source.fetch(['AAPL'], '2018-06-01', '2018-06-30')
+        self.source.fetch(['AAPL'], '2018-01-01', '2018-01-31')
+
+        self.assertEqual(self.remote.requests[-1][1:], (pd.Timestamp('2018-01-01'), pd.Timestamp('2018-05-31')))
+        self.assertEqual(len(self.source.fetch(['AAPL'], '2018-03-01', '2018-03-31')['AAPL']), 31)
+        self.assertEqual(len(self.remote.requests), 2)
+
+    def test_cached_request_is_not_fetched(self):
+        self.source.fetch(['AAPL'], '2018-01-01', '2018-03-31')
+        self.assertEqual(self.source.missing_ranges('AAPL', '2018-02-01', '2018-02-28'), [])
+        self.assertEqual(len(self.source.fetch(['AAPL'], '2018-02-01', '2018-02-28')['AAPL']), 28)
+        self.assertEqual(len(self.remote.requests), 1)
+
+    def stub_cache(self, responses: list=()) -> tuple:
+        stub = StubSource(responses)
+        return stub, CachedSource(stub, os.path.join(self.directory, 'stub'))
+
+    def test_empty_response_is_not_covered(self):
+        stub, source = self.stub_cache([None])
+
+        self.assertEqual(source.fetch(['AAPL'], '2018-01-01', '2018-01-31'), {})
+        self.assertEqual(source.missing_ranges('AAPL', '2018-01-01', '2018-01-31'),
+                         [(pd.Timestamp('2018-01-01'), pd.Timestamp('2018-01-31'))])
+
+        self.assertEqual(len(source.fetch(['AAPL'], '2018-01-01', '2018-01-31')['AAPL']), 31)
+        self.assertEqual(len(stub.requests), 2)
+
+    def test_partial_response_is_covered_up_to_its_last_date(self):
+        stub, source = self.stub_cache(['2018-01-15'])
+
+        self.assertEqual(len(source.fetch(['AAPL'], '2018-01-01', '2018-01-31')['AAPL']), 15)
+        self.assertEqual(source.missing_ranges('AAPL', '2018-01-01', '2018-01-31'),
+                         [(pd.Timestamp('2018-01-16'), pd.Timestamp('2018-01-31'))])
+
+        self.assertEqual(len(source.fetch(['AAPL'], '2018-01-10', '2018-01-31')['AAPL']), 22)
+        self.assertEqual(stub.requests[-1][1:], (pd.Timestamp('2018-01-16'), pd.Timestamp('2018-01-31')))
+
+    def test_partial_earlier_response_leaves_coverage(self):
+        stub, source = self.stub_cache(['2018-06-30', '2018-03-15'])
+        source.fetch(['AAPL'], '2018-06-01', '2018-06-30')
+
+        # Stopping at March 15 would leave a hole before June, so only June stays covered
+        source.fetch(['AAPL'], '2018-01-01', '2018-01-31')
+        self.assertEqual(source.missing_ranges('AAPL', '2018-04-01', '2018-04-30'),
+                         [(pd.Timestamp('2018-04-01'), pd.Timestamp('2018-05-31'))])
+
+    def test_today_is_never_covered(self):
+        stub, source = self.stub_cache()
+        today = pd.Timestamp('today').normalize()
+
+        source.fetch(['AAPL'], today - pd.Timedelta(days=10))
+        self.assertEqual(source.missing_ranges('AAPL', today - pd.Timedelta(days=10)), [(today, today)])
+
+        source.fetch(['AAPL'], today - pd.Timedelta(days=10))
+        self.assertEqual(stub.requests[-1][1:], (today, today))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import datetime as dt
+import threading
+import unittest
+
+from twitterscrape import local_analyzer, local_fetcher, process_days
+
+
+class ProcessDaysTest(unittest.TestCase):
+    start_date, end_date = dt.date(2017, 11, 11), dt.date(2018, 2, 4)
+
+    def test_matches_sequential(self):
+        fetch, analyze = local_fetcher(tweets_per_day=120), local_analyzer()
+
+        sequential = process_days(self.start_date, self.end_date, 50, 9, fetch, analyze, fetch_workers=1,
+                                  analyze_workers=1, queue_size=1)
+        parallel = process_days(self.start_date, self.end_date, 50, 9, fetch, analyze, fetch_workers=8,
+                                analyze_workers=8, queue_size=4)
+
+        self.assertEqual(len(sequential), 85)
+        self.assertEqual(sequential, parallel)
+
+    def test_fetch_error_stops_fetching(self):
+        calls = []
+        lock = threading.Lock()
+
+        def fetch(date, limit):
+            with lock:
+                calls.append(date)
+            raise IOError('no network')
+
+        with self.assertRaises(IOError):
+            process_days(self.start_date, self.end_date, 50, 9, fetch, local_analyzer(), fetch_workers=4)
+
+        # Only the fetches already under way when the first one failed may have run
+        self.assertLessEqual(len(calls), 4)
+
+    def test_analyze_error_stops_fetching(self):
+        calls = []
+        lock = threading.Lock()
+        local = local_fetcher(tweets_per_day=50)
+
+        def fetch(date, limit):
+            with lock:
+                calls.append(date)
+            return local(date, limit)
+
+        def analyze(text_to_send):
+            raise RuntimeError('endpoint down')
+
+        with self.assertRaises(RuntimeError):
+            process_days(self.start_date, self.end_date, 50, 9, fetch, analyze, fetch_workers=2, queue_size=2)
+
+        self.assertLess(len(calls), 85)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,82 +1,370 @@
-from twitterscraper import query_tweets
-from watson_developer_cloud import ToneAnalyzerV3
-import json
 import datetime as dt
-
-tone_analyzer = ToneAnalyzerV3(
-    username='df7be747-9985-416c-86bb-d7855b8eb0ff',
-    password='2Ohu6sUN2KiP',
-    version='2017-09-26'
-)
+import queue
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 tones = ['sad', 'frustrated', 'satisfied', 'excited', 'polite', 'impolite', 'sympathetic']
 
+WATSON_CREDENTIALS = {'username': 'df7be747-9985-416c-86bb-d7855b8eb0ff', 'password': '2Ohu6sUN2KiP',
+                      'version': '2017-09-26'}
+
+# The fields of twitterscraper's Tweet used here, for the local stand-in
+Tweet = namedtuple('Tweet', ['timestamp', 'text'])
+
+PipelineStats = namedtuple('PipelineStats', ['days', 'tweets', 'seconds', 'tweets_per_second'])
+
+
+class RateLimiter:
+    """Spaces calls out evenly so there are at most rate of them per second, across every thread that shares it."""
+
+    def __init__(self, rate: float=None):
+        """Creates the limiter.
+
+        :param rate: The largest number of calls per second. Defaults to None, meaning no limit.
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError('rate must be positive, got %s instead' % rate)
+
+        self.rate = rate
+        self._next = 0.
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until the next call is allowed."""
+        if self.rate is None:
+            return
+
+        with self._lock:
+            now = time.perf_counter()
+            slot = max(now, self._next)
+            self._next = slot + 1. / self.rate
 
-def analyze_batch(text_to_send: list) -> list:
-    resp = tone_analyzer.tone_chat(text_to_send)
+        if slot > now:
+            time.sleep(slot - now)
 
-    utterances_tone = resp['utterances_tone']
 
+def twitter_fetcher(query: str='Bitcoin', lang: str='en'):
+    """Creates a fetch function backed by twitterscraper.
+
+    :param query: The search query.
+    :param lang: The language of the tweets.
+    :return: A function of (date, limit) to a list of tweets from that day.
+    """
+    from twitterscraper import query_tweets
+
+    def fetch(date: dt.date, limit: int) -> list:
+        return query_tweets(query, limit=limit, begindate=date, enddate=date + dt.timedelta(days=1), lang=lang,
+                            poolsize=1)
+
+    return fetch
+
+
+def parse_tones(resp: dict) -> list:
+    """Reads the tones of each utterance from a ToneAnalyzer tone_chat response.
+
+    :param resp: The response.
+    :return: A list with a list of (score, tone id) tuples per utterance.
+    """
     utterance_tones = []
 
-    for utterance in utterances_tone:
+    for utterance in resp['utterances_tone']:
         utterance_tones.append(list((tone['score'], tone['tone_id']) for tone in utterance['tones']))
 
     return utterance_tones
 
 
-def grab_tweets(date: dt.date, batch_size: int, batches: int):
-    tweet_batch = query_tweets("Bitcoin", limit=batch_size * batches * 10, begindate=date, enddate=date + dt.timedelta(days=1), lang='en', poolsize=1)
-    for batch in [tweet_batch[i * batch_size:(i * batch_size) + batch_size] for i in range(batches)]:
-        yield batch
+def watson_analyzer(username: str=WATSON_CREDENTIALS['username'], password: str=WATSON_CREDENTIALS['password'],
+                    version: str=WATSON_CREDENTIALS['version']):
+    """Creates an analyze function backed by the Watson ToneAnalyzer.
+
+    :return: A function of a list of {'text': ...} utterances to their tones (see parse_tones).
+    """
+    from watson_developer_cloud import ToneAnalyzerV3
+
+    tone_analyzer = ToneAnalyzerV3(username=username, password=password, version=version)
+
+    def analyze(text_to_send: list) -> list:
+        return parse_tones(tone_analyzer.tone_chat(text_to_send))
+
+    return analyze
+
+
+def local_fetcher(tweets_per_day: int=500, latency: float=0., seed: int=0):
+    """Creates a fetch function that makes up tweets, standing in for twitter_fetcher without a network.
+
+    :param tweets_per_day: The number of tweets of each day (at most the limit asked for).
+    :param latency: The seconds each call takes, to act like a network request.
+    :param seed: The seed of the made up tweets, which are the same for the same date and seed.
+    :return: A function of (date, limit) to a list of Tweets from that day.
+    """
+    words = ['bitcoin', 'moon', 'crash', 'hodl', 'buy', 'sell', 'scam', 'love', 'hate', 'wow', 'thanks', 'sorry']
+
+    def fetch(date: dt.date, limit: int) -> list:
+        time.sleep(latency)
+        rng = random.Random('%s:%s' % (seed, date.isoformat()))
+        start = dt.datetime(date.year, date.month, date.day)
+
+        seconds = sorted(rng.randrange(86400) for _ in range(min(tweets_per_day, limit)))
+        return [Tweet(start + dt.timedelta(seconds=s), ' '.join(rng.choice(words) for _ in range(8))) for s in seconds]
+
+    return fetch
+
+
+def local_analyzer(latency: float=0.):
+    """Creates an analyze function that scores utterances from a hash of their text, standing in for watson_analyzer
+       without a network. Responses go through parse_tones like the real ones.
+
+    :param latency: The seconds each call takes, to act like a network request.
+    :return: A function of a list of {'text': ...} utterances to their tones (see parse_tones).
+    """
+    def analyze(text_to_send: list) -> list:
+        time.sleep(latency)
+
+        utterances = []
+        for i, utterance in enumerate(text_to_send):
+            rng = random.Random(utterance['text'])
+            found = [{'score': round(rng.uniform(0.5, 1.), 6), 'tone_id': t} for t in tones if rng.random() < 0.3]
+            utterances.append({'utterance_id': i, 'tones': found})
+
+        return parse_tones({'utterances_tone': utterances})
+
+    return analyze
+
+
+def grab_tweets(date: dt.date, batch_size: int, batches: int, fetch=None):
+    """Fetches the tweets of a day and splits them into batches.
+
+    :param date: The day.
+    :param batch_size: The number of tweets per batch.
+    :param batches: The largest number of batches.
+    :param fetch: A function of (date, limit) to a list of tweets. Defaults to None, meaning twitter_fetcher().
+    :return: A generator of lists of tweets.
+    """
+    fetch = fetch or twitter_fetcher()
+    tweet_batch = fetch(date, batch_size * batches * 10)
+
+    for i in range(batches):
+        batch = tweet_batch[i * batch_size:(i + 1) * batch_size]
+
+        if len(batch):
+            yield batch
 
 
-def process_days(start_date: dt.date, end_date: dt.date, batch_size: int, batches: int) -> list:
-    current_date = start_date
+def _put(items: queue.Queue, item, stop: threading.Event) -> bool:
+    """Puts an item into a bounded queue unless the pipeline stops while waiting for room."""
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
 
+    return False
+
+
+def process_days(start_date: dt.date, end_date: dt.date, batch_size: int, batches: int, fetch=None, analyze=None,
+                 fetch_workers: int=4, analyze_workers: int=4, queue_size: int=16, fetch_rate: float=None,
+                 analyze_rate: float=None, on_day=None) -> list:
+    """Fetches and analyzes the tweets of every day from start_date to end_date (exclusive) in a pipeline: a pool of
+       threads fetches days in parallel and puts their batches into a bounded queue, which a second pool of threads
+       sends to the tone analyzer. The queue keeps the fetchers from running far ahead of the analyzers.
+
+    :param start_date: The first day.
+    :param end_date: The day after the last one.
+    :param batch_size: The number of tweets per analyzer request.
+    :param batches: The largest number of batches per day.
+    :param fetch: A function of (date, limit) to a list of tweets (see twitter_fetcher and local_fetcher). Defaults to
+        None, meaning twitter_fetcher().
+    :param analyze: A function of a list of {'text': ...} utterances to their tones (see watson_analyzer and
+        local_analyzer). Defaults to None, meaning watson_analyzer().
+    :param fetch_workers: The number of days fetched at once.
+    :param analyze_workers: The number of analyzer requests at once.
+    :param queue_size: The largest number of batches waiting for the analyzers.
+    :param fetch_rate: The largest number of fetches per second. Defaults to None, meaning no limit.
+    :param analyze_rate: The largest number of analyzer requests per second. Defaults to None, meaning no limit.
+    :param on_day: A function of (date, list of responses) called in date order as soon as each day and the days
+        before it are done, e.g. to write them out. Defaults to None.
+    :return: A list with a list of (timestamp, text, utterance tones) responses per day.
+    """
+    fetch = fetch or twitter_fetcher()
+    analyze = analyze or watson_analyzer()
+
+    dates = [start_date + dt.timedelta(days=i) for i in range((end_date - start_date).days)]
+    fetch_limiter, analyze_limiter = RateLimiter(fetch_rate), RateLimiter(analyze_rate)
+
+    batch_queue = queue.Queue(maxsize=queue_size)
+    events = queue.Queue()
+    stop = threading.Event()
+
+    def fetch_day(day: int):
+        if stop.is_set():
+            return
+
+        try:
+            fetch_limiter.wait()
+            count = 0
+
+            if stop.is_set():
+                return
+
+            for i, tweet_batch in enumerate(grab_tweets(dates[day], batch_size, batches, fetch)):
+                if stop.is_set() or not _put(batch_queue, (day, i, tweet_batch), stop):
+                    return
+                count += 1
+
+            events.put(('fetched', day, count))
+        except Exception as e:
+            stop.set()
+            events.put(('error', day, e))
+
+    def analyze_batches():
+        while True:
+            item = batch_queue.get()
+
+            if item is None:
+                return
+
+            if stop.is_set():
+                continue
+
+            day, i, tweet_batch = item
+            try:
+                analyze_limiter.wait()
+                utterance_tones = analyze([{'text': tweet.text} for tweet in tweet_batch])
+
+                # timestamp, text, utterance_tones
+                combined_data = [(tweet.timestamp, tweet.text, utterance_tones[j])
+                                 for j, tweet in enumerate(tweet_batch)]
+                events.put(('analyzed', day, (i, combined_data)))
+            except Exception as e:
+                stop.set()
+                events.put(('error', day, e))
+
+    batch_counts, day_batches = {}, {day: [] for day in range(len(dates))}
     total_responses = []
 
-    while current_date < end_date:
-        print('Processing date: %s' % current_date)
-        day_responses = []
+    analyzers = [threading.Thread(target=analyze_batches, daemon=True) for _ in range(analyze_workers)]
+    for thread in analyzers:
+        thread.start()
+
+    try:
+        with ThreadPoolExecutor(fetch_workers) as executor:
+            futures = []
+            try:
+                for day in range(len(dates)):
+                    futures.append(executor.submit(fetch_day, day))
 
-        for tweet_batch in grab_tweets(current_date, batch_size, batches):
-            text_to_send = [{'text': i.text} for i in tweet_batch]
-            utterance_tones = analyze_batch(text_to_send)
+                while len(total_responses) < len(dates):
+                    kind, day, value = events.get()
 
-            combined_data = []  # timestamp, text, utterance_tones
-            for i in range(len(tweet_batch)):
-                combined_data.append((tweet_batch[i].timestamp, tweet_batch[i].text, utterance_tones[i]))
+                    if kind == 'error':
+                        raise value
+                    elif kind == 'fetched':
+                        batch_counts[day] = value
+                    else:
+                        day_batches[day].append(value)
 
-            day_responses.extend(combined_data)
+                    # Hand over every finished day in date order
+                    while len(total_responses) < len(dates):
+                        next_day = len(total_responses)
 
-        total_responses.append(day_responses)
+                        if batch_counts.get(next_day) != len(day_batches[next_day]):
+                            break
 
-        current_date += dt.timedelta(days=1)
+                        day_responses = [row for _, rows in sorted(day_batches.pop(next_day)) for row in rows]
+                        total_responses.append(day_responses)
+
+                        if on_day is not None:
+                            on_day(dates[next_day], day_responses)
+            except BaseException:
+                # Drop the days not fetched yet, so leaving the executor only waits for the fetches under way
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        stop.set()
+
+        for _ in analyzers:
+            batch_queue.put(None)
+        for thread in analyzers:
+            thread.join()
 
     return total_responses
 
 
+def write_responses(file, responses: list):
+    """Writes the responses of a day as rows of create_file."""
+    for response in responses:
+
+        file.write('%s' % response[0])
+        for tone in tones:
+            for response_tone in response[2]:
+                if response_tone[1] == tone:
+                    file.write(',%s' % response_tone[0])
+                    break
+            else:
+                file.write(',0.0')
+        file.write(',%s\n' % response[1].replace('\n', '').replace(',', '').replace('"', '').replace('\'', '').strip())
+
+
 def create_file(output_file: str, responses: list):
     print('Creating file: %s' % output_file)
     with open(output_file, 'w') as file:
         file.write('timestamp,sad,frustrated,satisfied,excited,polite,impolite,sympathetic,text\n')
 
         for response_by_day in responses:
-            for response in response_by_day:
+            write_responses(file, response_by_day)
+
+
+def scrape(output_file: str, start_date: dt.date, end_date: dt.date, batch_size: int, batches: int,
+           **pipeline) -> PipelineStats:
+    """Runs process_days and writes each day to a csv (see create_file) as soon as it is done.
+
+    :param output_file: The path of the csv.
+    :param start_date: The first day.
+    :param end_date: The day after the last one.
+    :param batch_size: The number of tweets per analyzer request.
+    :param batches: The largest number of batches per day.
+    :param pipeline: The other arguments of process_days (fetch, analyze, workers and rates).
+    :return: A PipelineStats.
+    """
+    start = time.perf_counter()
+    tweets = [0]
+
+    with open(output_file, 'w') as file:
+        file.write('timestamp,sad,frustrated,satisfied,excited,polite,impolite,sympathetic,text\n')
+
+        def on_day(date, day_responses):
+            write_responses(file, day_responses)
+            file.flush()
+
+            tweets[0] += len(day_responses)
+            seconds = time.perf_counter() - start
+            print('Processed date: %s (%s tweets, %.1f tweets/s so far)' %
+                  (date, len(day_responses), tweets[0] / seconds if seconds > 0 else 0.))
+
+        days = process_days(start_date, end_date, batch_size, batches, on_day=on_day, **pipeline)
+
+    seconds = time.perf_counter() - start
+
+    return PipelineStats(len(days), tweets[0], seconds, tweets[0] / seconds if seconds > 0 else 0.)
 
-                file.write('%s' % response[0])
-                for tone in tones:
-                    for response_tone in response[2]:
-                        if response_tone[1] == tone:
-                            file.write(',%s' % response_tone[0])
-                            break
-                    else:
-                        file.write(',0.0')
-                file.write(',%s\n' % response[1].replace('\n', '').replace(',', '').replace('"', '').replace('\'', '').strip())
 
+if __name__ == '__main__':
+    # Usage: twitterscrape.py [output file] [local]
+    # local uses made up tweets and tones (local_fetcher and local_analyzer) instead of Twitter and Watson.
+    output_file = sys.argv[1] if len(sys.argv) > 1 else 'out.csv'
 
-data = process_days(dt.date(2017, 11, 11), dt.date(2018, 2, 4), 50, 9)
-create_file('out.csv', data)
+    if 'local' in sys.argv[2:]:
+        sources = {'fetch': local_fetcher(latency=0.2), 'analyze': local_analyzer(latency=0.05)}
+    else:
+        sources = {}
 
-print('Yip')
\ No newline at end of file
+    stats = scrape(output_file, dt.date(2017, 11, 11), dt.date(2018, 2, 4), 50, 9, **sources)
+    print('Wrote %s tweets from %s days in %.2fs (%.1f tweets/s)' %
+          (stats.tweets, stats.days, stats.seconds, stats.tweets_per_second))